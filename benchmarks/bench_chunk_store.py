@@ -0,0 +1,47 @@
+"""
+Compare storing an edited version as a full copy and as deduplicated chunks
+
+Stores a random file, then versions with a small edit at a random offset,
+and reports bytes written and time for each. Run from the repository root:
+
+    python -m benchmarks.bench_chunk_store --size 20 --versions 10
+"""
+import os
+import io
+import time
+import random
+import argparse
+import tempfile
+from src import chunk_store
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=20, help='File size in MiB')
+    parser.add_argument('--versions', type=int, default=10)
+    args = parser.parse_args()
+
+    data = bytearray(os.urandom(args.size * 1024 * 1024))
+    with tempfile.TemporaryDirectory() as tmp:
+        chunk_store.CHUNK_STORE_DIR = tmp
+
+        start = time.perf_counter()
+        result = chunk_store.store_stream(io.BytesIO(data))
+        elapsed = time.perf_counter() - start
+        print(f"initial {len(data) / elapsed / 1e6:>10.1f} MB/s {result['chunks']} chunks")
+
+        full = chunked = 0
+        start = time.perf_counter()
+        for _ in range(args.versions):
+            offset = random.randrange(len(data))
+            data[offset:offset] = os.urandom(100)
+            full += len(data)
+            result = chunk_store.store_stream(io.BytesIO(data))
+            chunked += result['stored_size']
+        elapsed = time.perf_counter() - start
+
+        print(f"{args.versions} edited versions, {elapsed * 1000 / args.versions:.1f} ms each")
+        print(f"full copies {full:>14} bytes written")
+        print(f"chunked     {chunked:>14} bytes written ({chunked / full:.2%})")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Compare the legacy JSON files database with the binary FileStore
+
+Measures on-disk size, load time and memory held after loading for N
+records, half of them signed. Run from the repository root:
+
+    python -m benchmarks.bench_file_records --records 200000
+"""
+import os
+import gc
+import json
+import time
+import uuid
+import argparse
+import tempfile
+import tracemalloc
+from src.file_store import FileStore
+from src.models.file_record import FileRecord, FileStatus
+
+def make_records(count):
+    """Build legacy-style dict records like the ones main.py used to store"""
+    records = {}
+    now = int(time.time())
+    for i in range(count):
+        file_id = str(uuid.uuid4())
+        record = {
+            'filename': f"contract-{i}.pdf",
+            'path': f"/src/static/uploads/{file_id}_contract-{i}.pdf",
+            'size': 100000 + i,
+            'timestamp': now - i,
+            'status': 'uploaded',
+            'signature': None,
+            'stored_size': 100000 + i,
+            'encoding': None,
+            'sha256': uuid.uuid4().hex * 2,
+            'content_type': 'application/pdf'
+        }
+        if i % 2:
+            record['status'] = 'signed'
+            record['signer'] = f"did:example:{i}"
+            record['signature'] = {
+                'file_hash': 'q83vEjRWeJCrze8SNFZ4kKvN7xI0VniQq83vEjRWeJA=',
+                'algorithm': 'SHA256withECDSA',
+                'signer': f"did:example:{i}",
+                'timestamp': now - i,
+                'signature_type': 'swiyu-presentation'
+            }
+        records[file_id] = record
+    return records
+
+def measure(label, load):
+    """Run a loader, reporting wall time and memory still held afterwards"""
+    # Time and memory are measured in separate runs since tracing slows loading down
+    gc.collect()
+    start = time.perf_counter()
+    result = load()
+    elapsed = time.perf_counter() - start
+    del result
+
+    gc.collect()
+    tracemalloc.start()
+    result = load()
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<34} {elapsed * 1000:>10.1f} ms {held / 1024 / 1024:>10.1f} MB")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--records', type=int, default=200000)
+    args = parser.parse_args()
+
+    legacy = make_records(args.records)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, 'files_db.json')
+        bin_path = os.path.join(tmp, 'files_db.bin')
+
+        with open(json_path, 'w') as f:
+            json.dump(legacy, f)
+        store = FileStore(bin_path)
+        for file_id, data in legacy.items():
+            store[file_id] = FileRecord.from_dict(data)
+        store.save()
+        del legacy, store
+
+        print(f"{args.records} records")
+        print(f"{'json size':<34} {os.path.getsize(json_path) / 1024 / 1024:>10.1f} MB")
+        print(f"{'binary size':<34} {os.path.getsize(bin_path) / 1024 / 1024:>10.1f} MB")
+        print(f"{'':<34} {'load time':>13} {'memory held':>13}")
+
+        def load_json():
+            with open(json_path) as f:
+                return json.load(f)
+
+        def load_json_records():
+            return {k: FileRecord.from_dict(v) for k, v in load_json().items()}
+
+        def load_store_decoded():
+            store = FileStore(bin_path)
+            for file_id in store:
+                store[file_id]
+            return store
+
+        measure('json -> dicts', load_json)
+        measure('json -> FileRecord', load_json_records)
+        measure('binary, lazy (index only)', lambda: FileStore(bin_path))
+        store = measure('binary, all records decoded', load_store_decoded)
+
+        start = time.perf_counter()
+        signed = sum(1 for file_id in store if store[file_id].status == FileStatus.SIGNED)
+        print(f"{'scan decoded records':<34} {(time.perf_counter() - start) * 1000:>10.1f} ms ({signed} signed)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Measure transparency log append throughput and inclusion proof latency
+
+Appends N entries, then builds and verifies proofs for random leaves
+against the final tree head. Run from the repository root:
+
+    python -m benchmarks.bench_transparency_log --entries 1000000
+"""
+import time
+import random
+import base64
+import argparse
+import tempfile
+from src import transparency_log
+from src.transparency_log import TransparencyLog, entry_bytes, verify_inclusion
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--entries', type=int, default=1000000)
+    parser.add_argument('--proofs', type=int, default=10000)
+    args = parser.parse_args()
+
+    signature = {
+        'file_hash': 'q83vEjRWeJCrze8SNFZ4kKvN7xI0VniQq83vEjRWeJA=',
+        'algorithm': 'SHA256withECDSA',
+        'signer': 'did:example:123',
+        'timestamp': int(time.time()),
+        'signature_type': 'swiyu-presentation'
+    }
+    # Anchor only at the end so the run measures appends, not head signing
+    transparency_log.TRANSPARENCY_BATCH_SIZE = args.entries
+    transparency_log.TRANSPARENCY_BATCH_INTERVAL = 1 << 30
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log = TransparencyLog(tmp)
+        log._anchor(0)
+        entries = [entry_bytes(f"file-{i}", signature) for i in range(args.entries)]
+
+        start = time.perf_counter()
+        for data in entries:
+            log.append(data)
+        elapsed = time.perf_counter() - start
+        print(f"{args.entries} appends {elapsed:>10.2f} s {args.entries / elapsed:>10.0f} /s")
+
+        head = log.latest_head()
+        root = base64.b64decode(head['root_hash'])
+        indexes = [random.randrange(args.entries) for _ in range(args.proofs)]
+
+        start = time.perf_counter()
+        proofs = [log.inclusion_proof(i) for i in indexes]
+        elapsed = time.perf_counter() - start
+        print(f"{args.proofs} proofs {elapsed * 1000 / args.proofs:>13.3f} ms each "
+              f"({len(proofs[0]['audit_path'])} hashes)")
+
+        start = time.perf_counter()
+        for i, proof in zip(indexes, proofs):
+            path = [base64.b64decode(h) for h in proof['audit_path']]
+            leaf = base64.b64decode(proof['leaf_hash'])
+            assert verify_inclusion(leaf, i, head['tree_size'], path, root)
+        elapsed = time.perf_counter() - start
+        print(f"{args.proofs} verifications {elapsed * 1000 / args.proofs:>6.3f} ms each")
+
+if __name__ == '__main__':
+    main()
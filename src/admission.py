@@ -0,0 +1,281 @@
+import os
+import math
+import time
+import uuid
+import sqlite3
+import logging
+import tempfile
+import functools
+import threading
+from flask import request, jsonify
+
+logger = logging.getLogger(__name__)
+
+# Shared store for counters; every worker on the host opens the same file
+ADMISSION_DB_PATH = os.getenv(
+    'ADMISSION_DB_PATH',
+    os.path.join(tempfile.gettempdir(), 'eid_admission.sqlite3')
+)
+
+# Leases older than this are assumed to belong to a crashed worker
+LEASE_TTL_SECONDS = int(os.getenv('ADMISSION_LEASE_TTL', '600'))
+
+# Retry-After sent when a concurrency pool is full
+POOL_RETRY_AFTER = int(os.getenv('ADMISSION_POOL_RETRY_AFTER', '5'))
+
+# Seconds between sweeps of buckets that have refilled, which behave like missing rows
+BUCKET_PRUNE_INTERVAL = int(os.getenv('ADMISSION_PRUNE_INTERVAL', '60'))
+
+def parse_rate(value):
+    """
+    Parse a rate limit of the form "count/seconds"
+
+    Args:
+        value: Rate string such as "20/60"
+
+    Returns:
+        tuple: (tokens per second, burst size)
+    """
+    count, _, seconds = value.partition('/')
+    count = float(count)
+    seconds = float(seconds or 1)
+    return count / seconds, count
+
+def client_ip():
+    """Return the client address of the current request"""
+    return request.remote_addr or 'unknown'
+
+def _reject(status, retry_after, message):
+    """Build a fast rejection response with a Retry-After header"""
+    response = jsonify({'error': message})
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+class AdmissionController:
+    """
+    Token bucket rate limiting and concurrency limits shared across workers
+
+    State lives in a local SQLite database in WAL mode, so every gunicorn
+    worker on the host sees the same buckets and in-flight leases. If the
+    store is unavailable requests are admitted rather than failed.
+    """
+
+    def __init__(self, db_path=None):
+        """
+        Initialize the admission controller
+
+        Args:
+            db_path: Path to the shared SQLite store
+        """
+        self.db_path = db_path or ADMISSION_DB_PATH
+        self.enabled = os.getenv('ADMISSION_CONTROL', 'on') != 'off'
+        self._local = threading.local()
+        self._next_prune = 0
+
+        if self.enabled:
+            try:
+                self._init_store()
+            except sqlite3.Error as e:
+                logger.error(f"Failed to initialize admission store: {e}")
+                self.enabled = False
+
+    def _connection(self):
+        """Return the SQLite connection for the current thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=1.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_store(self):
+        conn = self._connection()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS buckets ('
+            'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, '
+            'full_at REAL NOT NULL DEFAULT 0)'
+        )
+        # Stores created before buckets were pruned lack the refill time
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(buckets)')]
+        if 'full_at' not in columns:
+            conn.execute('ALTER TABLE buckets ADD COLUMN full_at REAL NOT NULL DEFAULT 0')
+        conn.execute('CREATE INDEX IF NOT EXISTS buckets_full_at ON buckets (full_at)')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS leases ('
+            'id TEXT PRIMARY KEY, pool TEXT NOT NULL, bytes INTEGER NOT NULL, '
+            'expires REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS leases_pool ON leases (pool, expires)')
+
+    def take_token(self, key, rate, burst):
+        """
+        Take one token from a bucket
+
+        Args:
+            key: Bucket key, e.g. "upload:ip:1.2.3.4"
+            rate: Refill rate in tokens per second
+            burst: Bucket capacity
+
+        Returns:
+            float: 0 if admitted, otherwise seconds until a token is available
+        """
+        now = time.time()
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT tokens, updated FROM buckets WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                tokens = burst
+            else:
+                tokens = min(burst, row[0] + (now - row[1]) * rate)
+
+            if tokens >= 1:
+                tokens -= 1
+                retry_after = 0
+            else:
+                retry_after = (1 - tokens) / rate
+
+            conn.execute(
+                'INSERT OR REPLACE INTO buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)',
+                (key, tokens, now, now + (burst - tokens) / rate)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        if now >= self._next_prune:
+            self._next_prune = now + BUCKET_PRUNE_INTERVAL
+            self.prune_buckets(now)
+        return retry_after
+
+    def prune_buckets(self, now=None):
+        """
+        Delete buckets that have refilled completely
+
+        A full bucket admits exactly like a missing one, so removing it
+        changes no decision and keeps the store bounded by recent keys.
+
+        Returns:
+            int: Number of buckets removed
+        """
+        try:
+            cursor = self._connection().execute(
+                'DELETE FROM buckets WHERE full_at <= ?', (now or time.time(),)
+            )
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            logger.error(f"Failed to prune admission buckets: {e}")
+            return 0
+
+    def acquire_lease(self, pool, max_concurrent, max_bytes, nbytes):
+        """
+        Reserve a slot and a byte budget in a concurrency pool
+
+        Args:
+            pool: Pool name, e.g. "upload"
+            max_concurrent: Maximum leases held at once
+            max_bytes: Maximum bytes reserved across all leases
+            nbytes: Bytes reserved by this lease
+
+        Returns:
+            str: Lease ID, or None if the pool is full
+        """
+        now = time.time()
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM leases WHERE pool = ? AND expires < ?', (pool, now))
+            count, reserved = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM leases WHERE pool = ?',
+                (pool,)
+            ).fetchone()
+
+            if count >= max_concurrent or reserved + nbytes > max_bytes:
+                conn.execute('COMMIT')
+                return None
+
+            lease_id = str(uuid.uuid4())
+            conn.execute(
+                'INSERT INTO leases (id, pool, bytes, expires) VALUES (?, ?, ?, ?)',
+                (lease_id, pool, nbytes, now + LEASE_TTL_SECONDS)
+            )
+            conn.execute('COMMIT')
+            return lease_id
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def release_lease(self, lease_id):
+        """Release a lease taken with acquire_lease"""
+        try:
+            self._connection().execute('DELETE FROM leases WHERE id = ?', (lease_id,))
+        except sqlite3.Error as e:
+            logger.error(f"Failed to release admission lease: {e}")
+
+    def limit(self, scope, rate, key_func=None, key_rate=None, pool=None,
+              max_concurrent=None, max_bytes=None):
+        """
+        Decorator applying admission control to a view
+
+        Args:
+            scope: Name used to namespace bucket keys
+            rate: Per client IP rate as "count/seconds"
+            key_func: Optional callable returning a secondary key (e.g. file_id)
+                from the view kwargs
+            key_rate: Rate for the secondary key as "count/seconds"
+            pool: Optional concurrency pool name
+            max_concurrent: Maximum in-flight requests in the pool
+            max_bytes: Maximum request bytes buffered across the pool
+
+        Returns:
+            Decorator for a Flask view function
+        """
+        ip_rate = parse_rate(rate)
+        secondary_rate = parse_rate(key_rate) if key_rate else None
+
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return view(*args, **kwargs)
+
+                lease_id = None
+                try:
+                    retry_after = self.take_token(f'{scope}:ip:{client_ip()}', *ip_rate)
+                    if retry_after:
+                        return _reject(429, retry_after, 'Too many requests')
+
+                    if key_func and secondary_rate:
+                        key = key_func(kwargs)
+                        if key:
+                            retry_after = self.take_token(f'{scope}:key:{key}', *secondary_rate)
+                            if retry_after:
+                                return _reject(429, retry_after, 'Too many requests for this file')
+
+                    if pool:
+                        # A body larger than the whole budget could never get a
+                        # lease, so retrying would not help
+                        if max_bytes and (request.content_length or 0) > max_bytes:
+                            return jsonify({'error': 'Upload too large'}), 413
+                        # Requests without a length are charged the full upload limit
+                        nbytes = request.content_length or max_bytes
+                        lease_id = self.acquire_lease(pool, max_concurrent, max_bytes, nbytes)
+                        if lease_id is None:
+                            return _reject(503, POOL_RETRY_AFTER, 'Server busy, try again later')
+                except sqlite3.Error as e:
+                    # Fail open: an unavailable store must not take the service down
+                    logger.error(f"Admission store error in {scope}: {e}")
+
+                try:
+                    return view(*args, **kwargs)
+                finally:
+                    if lease_id:
+                        self.release_lease(lease_id)
+
+            return wrapper
+        return decorator
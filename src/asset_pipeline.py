@@ -0,0 +1,140 @@
+import os
+import json
+import hashlib
+import logging
+import mimetypes
+import brotli
+import zopfli.gzip
+from flask import abort, request, send_file
+from src.storage import accepts_encoding
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Hand-written CSS/JS sources and the directory the fingerprinted bundles are built into
+ASSET_SOURCE_DIR = os.path.join(BASE_DIR, 'assets')
+ASSET_BUILD_DIR = os.path.join(BASE_DIR, 'static', 'dist')
+
+# Bundles served to the templates, each concatenated from source files in order
+BUNDLES = {
+    'app.css': ['css/base.css', 'css/upload.css', 'css/verify.css'],
+    'sign.css': ['css/sign.css'],
+    'trace.css': ['css/trace.css'],
+    'app.js': ['js/upload.js', 'js/sign.js', 'js/verify.js', 'js/share.js']
+}
+
+# Precompressed variants, in order of preference
+VARIANTS = [
+    ('br', '.br'),
+    ('gzip', '.gz')
+]
+
+# Fingerprinted files never change, so clients may cache them for a year
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+def _write_atomic(path, data):
+    """Write a file so concurrent workers never see a partial bundle"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+class AssetPipeline:
+    """
+    Bundles, fingerprints and precompresses static CSS/JS
+
+    Each bundle is written as name.<hash>.ext together with brotli and
+    zopfli-gzip variants. Templates reference bundles through asset_url(),
+    and /assets/ serves the best variant the client accepts with an
+    immutable Cache-Control header.
+    """
+
+    def __init__(self, source_dir=ASSET_SOURCE_DIR, build_dir=ASSET_BUILD_DIR,
+                 url_prefix='/assets'):
+        """
+        Initialize the asset pipeline
+
+        Args:
+            source_dir: Directory containing the CSS/JS sources
+            build_dir: Directory the fingerprinted bundles are written to
+            url_prefix: URL path the bundles are served under
+        """
+        self.source_dir = source_dir
+        self.build_dir = build_dir
+        self.url_prefix = url_prefix
+        self.manifest = {}
+
+    def build(self):
+        """
+        Build every bundle that is not already up to date
+
+        Returns:
+            dict: Mapping of bundle name to fingerprinted filename
+        """
+        os.makedirs(self.build_dir, exist_ok=True)
+
+        for name, sources in BUNDLES.items():
+            parts = []
+            for source in sources:
+                with open(os.path.join(self.source_dir, source), 'rb') as f:
+                    parts.append(f.read())
+            content = b'\n'.join(parts)
+
+            stem, ext = os.path.splitext(name)
+            fingerprint = hashlib.sha256(content).hexdigest()[:12]
+            built_name = f"{stem}.{fingerprint}{ext}"
+            built_path = os.path.join(self.build_dir, built_name)
+
+            # Content-hashed names mean an existing file is already correct
+            if not os.path.exists(built_path + '.gz'):
+                _write_atomic(built_path, content)
+                _write_atomic(built_path + '.br', brotli.compress(content, quality=11))
+                _write_atomic(built_path + '.gz', zopfli.gzip.compress(content))
+                logger.info(f"Built asset bundle {built_name}")
+
+            self.manifest[name] = built_name
+
+        _write_atomic(
+            os.path.join(self.build_dir, 'manifest.json'),
+            json.dumps(self.manifest, indent=2).encode('utf-8')
+        )
+        return self.manifest
+
+    def url(self, name):
+        """Return the fingerprinted URL of a bundle"""
+        return f"{self.url_prefix}/{self.manifest[name]}"
+
+    def serve(self, filename):
+        """Serve a fingerprinted bundle, precompressed if the client accepts it"""
+        if filename not in self.manifest.values():
+            abort(404)
+
+        path = os.path.join(self.build_dir, filename)
+        mimetype = mimetypes.guess_type(filename)[0]
+        accept_encoding = request.headers.get('Accept-Encoding', '')
+
+        encoding = None
+        for candidate, suffix in VARIANTS:
+            if accepts_encoding(accept_encoding, candidate):
+                encoding = candidate
+                path += suffix
+                break
+
+        response = send_file(path, mimetype=mimetype, max_age=31536000)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        response.vary.add('Accept-Encoding')
+        return response
+
+    def init_app(self, app):
+        """Build the bundles and register the template helper and route"""
+        self.build()
+        app.jinja_env.globals['asset_url'] = self.url
+        app.add_url_rule(f"{self.url_prefix}/<path:filename>", 'assets', self.serve)
+
+if __name__ == '__main__':
+    # Build the bundles ahead of time with: python -m src.asset_pipeline
+    for name, built_name in AssetPipeline().build().items():
+        print(f"{name} -> {built_name}")
@@ -0,0 +1,62 @@
+document.addEventListener('DOMContentLoaded', function() {
+    const shareForm = document.getElementById('share-form');
+
+    // Only the share page has a share form
+    if (!shareForm) {
+        return;
+    }
+
+    function postJson(url, body) {
+        return fetch(url, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify(body)
+        }).then(response => response.json());
+    }
+
+    // Each recipient gets a link of their own that can be revoked here
+    function addSentLink(threemaId, linkId) {
+        const item = document.createElement('li');
+        item.textContent = `Sent to ${threemaId} `;
+
+        const revokeButton = document.createElement('button');
+        revokeButton.type = 'button';
+        revokeButton.textContent = 'Revoke';
+        revokeButton.addEventListener('click', function() {
+            postJson(shareForm.dataset.revokeUrl, {link_id: linkId})
+                .then(data => {
+                    if (data.success) {
+                        item.textContent = `Revoked link of ${threemaId}`;
+                    } else {
+                        alert('Error revoking link: ' + data.error);
+                    }
+                });
+        });
+
+        item.appendChild(revokeButton);
+        document.getElementById('sent-links').appendChild(item);
+    }
+
+    shareForm.addEventListener('submit', function(e) {
+        e.preventDefault();
+        const threemaId = document.getElementById('threemaId').value.trim();
+
+        postJson(shareForm.dataset.sendUrl, {
+            threema_id: threemaId,
+            mode: document.getElementById('shareMode').value
+        })
+            .then(data => {
+                if (data.success) {
+                    addSentLink(threemaId, data.link_id);
+                } else {
+                    alert('Error sending link: ' + data.error);
+                }
+            })
+            .catch(error => {
+                console.error('Error:', error);
+                alert('An error occurred while sending the link.');
+            });
+    });
+});
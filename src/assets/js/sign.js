@@ -0,0 +1,61 @@
+// Function to check signature status
+function checkSignatureStatus() {
+    // The file ID and the uploader's share link are rendered into the QR code element
+    const qrCode = document.getElementById('qrCode');
+    const fileId = qrCode.dataset.fileId;
+    const query = qrCode.dataset.shareToken ? `?token=${encodeURIComponent(qrCode.dataset.shareToken)}` : '';
+
+    fetch(`/api/signature-status/${fileId}${query}`)
+        .then(response => response.json())
+        .then(data => {
+            // Signed files lead the uploader on to the share page
+            if (data.share_url) {
+                window.location.href = data.share_url;
+            } else if (data.status === 'signed') {
+                alert("The file is signed. Open the sign page from your upload link to share it.");
+            } else {
+                alert("Signature not yet completed. Please complete the signing process in the SWIYU App.");
+            }
+        })
+        .catch(error => {
+            console.error('Error checking signature status:', error);
+            alert("Error checking signature status. Please try again.");
+        });
+}
+
+// Function to open SWIYU App on mobile devices
+function openSWIYUApp() {
+    // Get the QR code data (the URL encoded in the QR)
+    const swiyuUrl = document.getElementById('qrCode').dataset.swiyuUrl;
+
+    // Check if on mobile device
+    if (/iPhone|iPad|iPod|Android/i.test(navigator.userAgent)) {
+        // Try to open the SWIYU app with the URL
+        // Use the correct URL scheme for SWIYU app
+        window.location.href = swiyuUrl;
+
+        // Set a timeout to check if app was opened
+        setTimeout(function() {
+            // If we're still here, the app might not be installed
+            if (document.hidden) {
+                // App was opened successfully
+                return;
+            }
+
+            // App wasn't opened, show download prompt
+            if (confirm("SWIYU App not detected. Would you like to download it?")) {
+                // Link to App Store for iOS
+                if (/iPhone|iPad|iPod/i.test(navigator.userAgent)) {
+                    window.location.href = "https://apps.apple.com/ch/app/swiyu/id1234567890";
+                }
+                // Link to Play Store for Android
+                else if (/Android/i.test(navigator.userAgent)) {
+                    window.location.href = "https://play.google.com/store/apps/details?id=ch.admin.swiyu";
+                }
+            }
+        }, 2000);
+    } else {
+        // On desktop, just show a message
+        alert("Please scan this QR code with your SWIYU App on your mobile device.");
+    }
+}
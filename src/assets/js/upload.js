@@ -0,0 +1,69 @@
+document.addEventListener('DOMContentLoaded', function() {
+    const uploadArea = document.getElementById('upload-area');
+    const fileInput = document.getElementById('file-input');
+    const fileName = document.getElementById('file-name');
+    const browseButton = document.getElementById('browse-button');
+    const uploadButton = document.getElementById('upload-button');
+    const uploadForm = document.getElementById('upload-form');
+    const progressBar = document.querySelector('.progress');
+    const progressBarInner = document.querySelector('.progress-bar');
+
+    // Only the upload page has an upload area
+    if (!uploadArea) {
+        return;
+    }
+
+    // Browse button click
+    browseButton.addEventListener('click', function() {
+        fileInput.click();
+    });
+
+    // File input change
+    fileInput.addEventListener('change', function() {
+        if (fileInput.files.length > 0) {
+            fileName.textContent = fileInput.files[0].name;
+            uploadButton.disabled = false;
+        } else {
+            fileName.textContent = '';
+            uploadButton.disabled = true;
+        }
+    });
+
+    // Drag and drop functionality
+    uploadArea.addEventListener('dragover', function(e) {
+        e.preventDefault();
+        uploadArea.classList.add('border-primary');
+    });
+
+    uploadArea.addEventListener('dragleave', function() {
+        uploadArea.classList.remove('border-primary');
+    });
+
+    uploadArea.addEventListener('drop', function(e) {
+        e.preventDefault();
+        uploadArea.classList.remove('border-primary');
+
+        if (e.dataTransfer.files.length > 0) {
+            fileInput.files = e.dataTransfer.files;
+            fileName.textContent = e.dataTransfer.files[0].name;
+            uploadButton.disabled = false;
+        }
+    });
+
+    // Form submission
+    uploadForm.addEventListener('submit', function() {
+        progressBar.style.display = 'flex';
+        uploadButton.disabled = true;
+
+        // Simulate progress (in a real app, you'd use XHR or Fetch API to track actual progress)
+        let progress = 0;
+        const interval = setInterval(function() {
+            progress += 5;
+            progressBarInner.style.width = progress + '%';
+
+            if (progress >= 100) {
+                clearInterval(interval);
+            }
+        }, 100);
+    });
+});
@@ -0,0 +1,50 @@
+document.addEventListener('DOMContentLoaded', function() {
+    const unsignButton = document.getElementById('unsign-button');
+    const qrCode = document.getElementById('qr-code');
+
+    if (unsignButton) {
+        // Unsign button click
+        unsignButton.addEventListener('click', function() {
+            // In a real implementation, this would initiate the E-ID authentication flow
+            // For this PoC, we'll simulate it
+
+            // Show QR code (simulating E-ID app scanning)
+            qrCode.style.display = 'block';
+            unsignButton.disabled = true;
+
+            // Simulate verification process
+            setTimeout(function() {
+                // In a real implementation, this would verify the user's E-ID
+
+                // Call the API to unsign the file
+                fetch(unsignButton.dataset.unsignUrl, {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json'
+                    }
+                })
+                .then(response => response.json())
+                .then(data => {
+                    if (data.success) {
+                        // Hide QR code
+                        qrCode.style.display = 'none';
+
+                        // Show success message
+                        alert('Identity verified successfully! You can now download the file.');
+
+                        // Enable download
+                        document.getElementById('download-section').style.display = 'block';
+                    } else {
+                        alert('Error verifying identity: ' + data.error);
+                        unsignButton.disabled = false;
+                    }
+                })
+                .catch(error => {
+                    console.error('Error:', error);
+                    alert('An error occurred while verifying your identity.');
+                    unsignButton.disabled = false;
+                });
+            }, 3000); // Simulate 3-second verification process
+        });
+    }
+});
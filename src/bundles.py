@@ -0,0 +1,220 @@
+import os
+import io
+import json
+import time
+import uuid
+import zipfile
+import logging
+from werkzeug.sansio.multipart import MultipartDecoder, Field, File, Data, Epilogue, NeedData
+from werkzeug.utils import secure_filename
+from src import storage
+
+logger = logging.getLogger(__name__)
+
+# Files accepted by one multi-file upload or bundle download
+BUNDLE_MAX_FILES = int(os.getenv('BUNDLE_MAX_FILES', '100'))
+
+# Largest non-file form field buffered from a multi-file upload
+MAX_FIELD_SIZE = 64 * 1024
+
+BUNDLE_MANIFEST_NAME = 'manifest.json'
+
+class BundleError(ValueError):
+    """A multi-file upload is malformed or exceeds the limits"""
+
+def save_parts(stream, boundary, upload_folder):
+    """
+    Store every file of a multipart/form-data body as it is received
+
+    Unlike request.files, parts are never spooled to temporary files: each
+    file part is written through storage.save_upload's writer chunk by chunk
+    while the body is read. If the body is malformed, every file stored so
+    far is removed.
+
+    Args:
+        stream: Readable binary stream of the request body
+        boundary: Multipart boundary from the Content-Type header
+        upload_folder: Directory the files are stored in
+
+    Returns:
+        tuple: (fields, files) where fields maps form field names to values
+            and files is a list of (file_id, filename, storage metadata)
+    """
+    # The decoder's limit applies to its buffer: part headers plus one unread chunk
+    decoder = MultipartDecoder(boundary.encode('latin-1'), MAX_FIELD_SIZE + storage.CHUNK_SIZE)
+    fields = {}
+    files = []
+    part = writer = None
+    field_data = None
+
+    try:
+        while True:
+            data = stream.read(storage.CHUNK_SIZE)
+            decoder.receive_data(data or None)
+            event = decoder.next_event()
+            while not isinstance(event, (Epilogue, NeedData)):
+                if isinstance(event, Field):
+                    part, field_data = event, bytearray()
+                elif isinstance(event, File):
+                    if len(files) >= BUNDLE_MAX_FILES:
+                        raise BundleError(f'At most {BUNDLE_MAX_FILES} files per upload')
+                    filename = secure_filename(event.filename or '')
+                    if not filename:
+                        raise BundleError('Every file needs a filename')
+                    file_id = str(uuid.uuid4())
+                    content_type = storage.guess_content_type(filename, event.headers.get('Content-Type'))
+                    part = (file_id, filename, content_type)
+                    writer = storage.StorageWriter(
+                        os.path.join(upload_folder, f"{file_id}_{filename}"),
+                        storage.choose_encoding(content_type)
+                    )
+                elif isinstance(event, Data):
+                    if writer is not None:
+                        writer.write(event.data)
+                    else:
+                        field_data += event.data
+                        if len(field_data) > MAX_FIELD_SIZE:
+                            raise BundleError('Form field too large')
+
+                    if not event.more_data:
+                        if writer is not None:
+                            file_id, filename, content_type = part
+                            meta = writer.close()
+                            meta['content_type'] = content_type
+                            files.append((file_id, filename, meta))
+                            writer = None
+                        else:
+                            fields[part.name] = field_data.decode('utf-8', 'replace')
+                event = decoder.next_event()
+
+            if isinstance(event, Epilogue) or not data:
+                break
+    except Exception as e:
+        if writer is not None:
+            writer.abort()
+        for _, _, meta in files:
+            try:
+                os.remove(meta['path'])
+            except OSError:
+                pass
+        # The decoder reports malformed bodies as ValueError
+        if isinstance(e, ValueError) and not isinstance(e, BundleError):
+            raise BundleError(f"Malformed upload: {e}") from e
+        raise
+
+    if not isinstance(event, Epilogue):
+        raise BundleError('Upload ended before the closing boundary')
+    return fields, files
+
+def signature_manifest(file_id, file_data):
+    """
+    Signature manifest of a file as included in bundles
+
+    Args:
+        file_id: ID of the file
+        file_data: FileRecord of the file
+
+    Returns:
+        dict: Digest, signer, signature and transparency log index
+    """
+    return {
+        'file_id': file_id,
+        'filename': file_data.filename,
+        'size': file_data.size,
+        'sha256': file_data.sha256,
+        'version': file_data.version,
+        'status': file_data.status.value,
+        'signer': file_data.signer,
+        'signature': file_data.signature.to_dict() if file_data.signature else None,
+        'log_index': file_data.log_index
+    }
+
+class _ZipOutput(io.RawIOBase):
+    """Write-only buffer the ZIP writer fills and the response generator drains"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._buffer += b
+        return len(b)
+
+    def drain(self):
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+def _unique_name(name, used):
+    """Rename duplicate entry names to name (2).ext, name (3).ext, ..."""
+    stem, ext = os.path.splitext(name)
+    candidate, n = name, 1
+    while candidate in used:
+        n += 1
+        candidate = f"{stem} ({n}){ext}"
+    used.add(candidate)
+    return candidate
+
+def stream_zip(files):
+    """
+    Build a ZIP of files and their signature manifests as it is sent
+
+    The archive is written to an unseekable buffer, so sizes and CRCs go
+    into data descriptors after each entry and nothing is written to disk.
+    The buffer is drained after every chunk, which keeps memory constant
+    whatever the size of the bundle. A top-level manifest.json lists all
+    files and doubles as a manifest for /api/verify-signatures.
+
+    Args:
+        files: List of (file_id, FileRecord or VersionRecord) in bundle order
+
+    Returns:
+        Generator of consecutive, non-empty pieces of the ZIP archive
+    """
+    # An empty piece would end a chunked response early
+    return (piece for piece in _build_zip(files, _ZipOutput()) if piece)
+
+def _build_zip(files, output):
+    """Write the archive to output, yielding what was written after each step"""
+    used = {BUNDLE_MANIFEST_NAME}
+    manifests = []
+
+    with zipfile.ZipFile(output, 'w') as archive:
+        for file_id, file_data in files:
+            name = _unique_name(file_data.filename, used)
+            content_type = file_data.content_type or storage.guess_content_type(file_data.filename)
+
+            # Media and archives are already compressed; deflating them only costs CPU
+            info = _zip_info(name, file_data.timestamp, storage.is_compressible(content_type))
+            # Known up front, so ZIP64 extensions are only used when needed
+            info.file_size = file_data.size
+
+            with archive.open(info, 'w') as entry, storage.open_original(file_data) as stream:
+                for chunk in iter(lambda: stream.read(storage.CHUNK_SIZE), b''):
+                    entry.write(chunk)
+                    yield output.drain()
+
+            manifest = signature_manifest(file_id, file_data)
+            manifest['path'] = name
+            manifests.append(manifest)
+            archive.writestr(
+                _zip_info(_unique_name(f"{name}.signature.json", used), file_data.timestamp),
+                json.dumps(manifest, indent=2)
+            )
+            yield output.drain()
+
+        archive.writestr(
+            _zip_info(BUNDLE_MANIFEST_NAME),
+            json.dumps({'file_ids': [manifest['file_id'] for manifest in manifests],
+                        'files': manifests}, indent=2)
+        )
+    yield output.drain()
+
+def _zip_info(name, timestamp=None, deflate=True):
+    """ZIP entry header; ZIP cannot store dates before 1980"""
+    date_time = time.localtime(time.time() if timestamp is None else timestamp)[:6]
+    info = zipfile.ZipInfo(name, max(date_time, (1980, 1, 1, 0, 0, 0)))
+    info.compress_type = zipfile.ZIP_DEFLATED if deflate else zipfile.ZIP_STORED
+    return info
@@ -0,0 +1,313 @@
+import os
+import io
+import json
+import time
+import hashlib
+import logging
+import brotli
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Directory of content-addressed chunks and manifests, on the uploads disk
+CHUNK_STORE_DIR = os.getenv(
+    'CHUNK_STORE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'uploads', 'chunks')
+)
+
+# Content-defined chunk sizes; the average must be a power of two
+CDC_MIN_SIZE = int(os.getenv('CDC_MIN_SIZE', str(16 * 1024)))
+CDC_AVG_SIZE = int(os.getenv('CDC_AVG_SIZE', str(64 * 1024)))
+CDC_MAX_SIZE = int(os.getenv('CDC_MAX_SIZE', str(256 * 1024)))
+
+# Read size when streaming uploads into the chunker
+READ_SIZE = 1024 * 1024
+
+# Gear table: a fixed pseudo-random 32-bit value per byte value. Derived
+# from SHA-256 so boundaries never change between releases or platforms.
+_GEAR = np.array(
+    [int.from_bytes(hashlib.sha256(bytes([i])).digest()[:4], 'big') for i in range(256)],
+    dtype=np.uint32
+)
+
+# The gear hash at a position depends on the 32 bytes ending there
+_WINDOW = 32
+
+def _mask(bits):
+    """Mask of the top bits of the hash, which cover the whole window"""
+    return np.uint32(((1 << bits) - 1) << (32 - bits))
+
+# Normalized chunking (FastCDC): a stricter mask before the average size and
+# a looser one after it pull chunk sizes towards the average
+_AVG_BITS = CDC_AVG_SIZE.bit_length() - 1
+_MASK_STRICT = _mask(_AVG_BITS + 2)
+_MASK_LOOSE = _mask(_AVG_BITS - 2)
+
+def _gear_hashes(data):
+    """
+    Gear hashes of every position in a buffer
+
+    The rolling hash h[i] = (h[i-1] << 1) + G[b[i]] equals the sum of
+    G[b[i-k]] << k over the last 32 bytes, which is built in five doubling
+    steps over the whole array instead of a loop per byte.
+    """
+    h = _GEAR[np.frombuffer(data, dtype=np.uint8)]
+    step = 1
+    while step < _WINDOW:
+        h[step:] += h[:-step] << np.uint32(step)
+        step *= 2
+    return h
+
+class Chunker:
+    """
+    Split a stream into content-defined chunks
+
+    Boundaries depend only on the 32 bytes before them, so an edit only
+    changes the chunks around it. Candidate boundaries are found once per
+    fed block; cutting then just walks the candidates.
+    """
+
+    def __init__(self):
+        self._pending = bytearray()
+        self._start = 0
+        self._tail = b''
+        # (stream offset of the last byte of a chunk, passes the strict mask)
+        self._candidates = []
+
+    def feed(self, data):
+        """Add a block of the stream, yielding the chunks it completes"""
+        hashes = _gear_hashes(self._tail + data)[len(self._tail):]
+        base = self._start + len(self._pending)
+        loose = np.flatnonzero((hashes & _MASK_LOOSE) == 0)
+        if loose.size:
+            strict = (hashes[loose] & _MASK_STRICT) == 0
+            self._candidates.extend(zip((loose + base).tolist(), strict.tolist()))
+
+        self._tail = (self._tail + data)[-(_WINDOW - 1):]
+        self._pending += data
+        while len(self._pending) >= CDC_MAX_SIZE:
+            yield self._cut()
+
+    def finish(self):
+        """Yield the remaining chunks at the end of the stream"""
+        while self._pending:
+            yield self._cut()
+
+    def _cut(self):
+        end = min(len(self._pending), CDC_MAX_SIZE)
+        length = end
+        if end > CDC_MIN_SIZE:
+            # Boundaries inside the minimum size are never used
+            min_offset = self._start + CDC_MIN_SIZE
+            skip = 0
+            while skip < len(self._candidates) and self._candidates[skip][0] < min_offset:
+                skip += 1
+            del self._candidates[:skip]
+
+            for offset, strict in self._candidates:
+                position = offset - self._start
+                if position >= end:
+                    break
+                if strict or position >= CDC_AVG_SIZE:
+                    length = position + 1
+                    break
+
+        chunk = bytes(self._pending[:length])
+        del self._pending[:length]
+        self._start += length
+        return chunk
+
+def _chunk_path(key, encoding=None):
+    return os.path.join(CHUNK_STORE_DIR, key[:2], key + ('.br' if encoding == 'br' else ''))
+
+def _manifest_path(manifest_id):
+    return os.path.join(CHUNK_STORE_DIR, 'manifests', f"{manifest_id}.json")
+
+def _write_atomic(path, data):
+    """Write a file under a temporary name and rename it into place"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def _touch(path):
+    """
+    Mark a stored file as just used, if it exists
+
+    collect_garbage spares files younger than its grace period, so a reused
+    chunk or manifest is not deleted by a worker whose view of the live
+    versions predates the upload reusing it.
+
+    Returns:
+        bool: Whether the file exists
+    """
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+def _put_chunk(chunk, compress):
+    """
+    Store a chunk unless an identical one is already stored
+
+    Returns:
+        tuple: (manifest entry, bytes written)
+    """
+    key = hashlib.sha256(chunk).hexdigest()
+    for encoding in (None, 'br'):
+        if _touch(_chunk_path(key, encoding)):
+            return [key, len(chunk), encoding], 0
+
+    data, encoding = chunk, None
+    if compress:
+        compressed = brotli.compress(chunk, quality=5)
+        # Keep chunks that barely shrink raw so reads skip decompression
+        if len(compressed) < len(chunk) * 0.9:
+            data, encoding = compressed, 'br'
+    _write_atomic(_chunk_path(key, encoding), data)
+    return [key, len(chunk), encoding], len(data)
+
+def store_stream(stream, compress=False):
+    """
+    Split a stream into content-defined chunks and store the new ones
+
+    Every byte is read once: each chunk is hashed for its address and the
+    whole stream is hashed for the file digest in the same pass, so the
+    digest never has to be recomputed from the chunks.
+
+    Args:
+        stream: Readable binary stream of the original bytes
+        compress: Whether to brotli-compress new chunks
+
+    Returns:
+        dict: manifest, size, sha256, stored_size (bytes newly written),
+            chunks and new_chunks
+    """
+    sha256 = hashlib.sha256()
+    chunker = Chunker()
+    entries = []
+    size = stored_size = new_chunks = 0
+
+    def put(chunks):
+        nonlocal stored_size, new_chunks
+        for chunk in chunks:
+            entry, written = _put_chunk(chunk, compress)
+            entries.append(entry)
+            stored_size += written
+            new_chunks += bool(written)
+
+    for data in iter(lambda: stream.read(READ_SIZE), b''):
+        sha256.update(data)
+        size += len(data)
+        put(chunker.feed(data))
+    put(chunker.finish())
+
+    manifest = json.dumps(entries, separators=(',', ':')).encode('utf-8')
+    manifest_id = hashlib.sha256(manifest).hexdigest()
+    if not _touch(_manifest_path(manifest_id)):
+        _write_atomic(_manifest_path(manifest_id), manifest)
+        stored_size += len(manifest)
+
+    return {
+        'manifest': manifest_id,
+        'size': size,
+        'sha256': sha256.hexdigest(),
+        'stored_size': stored_size,
+        'chunks': len(entries),
+        'new_chunks': new_chunks
+    }
+
+def load_manifest(manifest_id):
+    """Return the [key, size, encoding] entries of a manifest"""
+    with open(_manifest_path(manifest_id), 'rb') as f:
+        return json.loads(f.read())
+
+def manifest_stat(manifest_id):
+    """
+    Identify the stored chunk files of a manifest as they are now
+
+    Suited as a cache key for values derived from the chunks: a chunk that
+    is rewritten gets a new inode, one truncated or extended in place a new
+    size. Modification times are left out because reusing a chunk refreshes
+    its mtime (see _touch).
+
+    Returns:
+        tuple: (inode, size) of every chunk file, in manifest order
+
+    Raises:
+        OSError: If the manifest or a chunk is missing
+    """
+    stats = []
+    for key, _, encoding in load_manifest(manifest_id):
+        stat = os.stat(_chunk_path(key, encoding))
+        stats.append((stat.st_ino, stat.st_size))
+    return tuple(stats)
+
+class _ChunkedReader(io.RawIOBase):
+    """Read-only stream over the chunks of a manifest"""
+
+    def __init__(self, manifest_id):
+        self._entries = iter(load_manifest(manifest_id))
+        self._buffer = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer:
+            entry = next(self._entries, None)
+            if entry is None:
+                return 0
+            key, _, encoding = entry
+            with open(_chunk_path(key, encoding), 'rb') as f:
+                data = f.read()
+            self._buffer = memoryview(brotli.decompress(data) if encoding == 'br' else data)
+
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+def open_manifest(manifest_id, buffer_size=64 * 1024):
+    """Open a stream over the original bytes of a manifest"""
+    return io.BufferedReader(_ChunkedReader(manifest_id), buffer_size)
+
+def collect_garbage(live_manifests, grace=3600):
+    """
+    Delete chunks and manifests no longer referenced by any file version
+
+    Args:
+        live_manifests: Manifest IDs still in use
+        grace: Files younger than this many seconds are kept, so uploads in
+            progress never lose their chunks
+
+    Returns:
+        int: Number of files removed
+    """
+    live_manifests = set(live_manifests)
+    live_chunks = set()
+    for manifest_id in live_manifests:
+        try:
+            live_chunks.update(entry[0] for entry in load_manifest(manifest_id))
+        except OSError as e:
+            logger.error(f"Missing chunk manifest {manifest_id}: {e}")
+
+    removed = 0
+    cutoff = time.time() - grace
+    for root, _, names in os.walk(CHUNK_STORE_DIR):
+        for name in names:
+            key = name.split('.', 1)[0]
+            if key in (live_manifests if root.endswith('manifests') else live_chunks):
+                continue
+            path = os.path.join(root, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+    if removed:
+        logger.info(f"Removed {removed} unreferenced chunks and manifests")
+    return removed
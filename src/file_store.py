@@ -0,0 +1,174 @@
+import os
+import json
+import mmap
+import struct
+import logging
+import threading
+from collections.abc import MutableMapping
+from src.models.file_record import FileRecord, SCHEMA_VERSION, encode_record, decode_record, decode_fields
+
+logger = logging.getLogger(__name__)
+
+# File header: magic, schema version, record count
+MAGIC = b'EIDF'
+_HEADER = struct.Struct('>4sHI')
+
+# Entry header: payload length, key length; followed by the key and the payload
+_ENTRY = struct.Struct('>IH')
+
+class FileStore(MutableMapping):
+    """
+    Mapping of file_id to FileRecord persisted in a compact binary file
+
+    Loading only scans the length-prefixed entry headers to build an index
+    of offsets into a memory-mapped file; a record is decoded the first time
+    it is accessed. Saving copies untouched entries byte for byte, so only
+    records that were read or changed are re-encoded.
+    """
+
+    def __init__(self, path, legacy_json_path=None):
+        """
+        Open the store, migrating a legacy JSON database if needed
+
+        Args:
+            path: Path to the binary store
+            legacy_json_path: Path to a files_db.json to import when the
+                binary store does not exist yet
+        """
+        self.path = path
+        self._entries = {}
+        self._buf = None
+        self._lock = threading.RLock()
+
+        if os.path.exists(path):
+            self._load()
+        elif legacy_json_path and os.path.exists(legacy_json_path):
+            self._migrate(legacy_json_path)
+
+    def _load(self):
+        """Index the entries of the binary store without decoding them"""
+        with open(self.path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count = _HEADER.unpack_from(buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a file store")
+        if version > SCHEMA_VERSION:
+            raise ValueError(f"Unsupported file store schema version {version}")
+
+        pos = _HEADER.size
+        for _ in range(count):
+            payload_len, key_len = _ENTRY.unpack_from(buf, pos)
+            key = buf[pos + _ENTRY.size:pos + _ENTRY.size + key_len].decode('utf-8')
+            # Records already decoded in memory take precedence over the file
+            if not isinstance(self._entries.get(key), FileRecord):
+                self._entries[key] = pos
+            pos += _ENTRY.size + key_len + payload_len
+
+        if self._buf is not None:
+            self._buf.close()
+        self._buf = buf
+
+    def _migrate(self, legacy_json_path):
+        """Import records from the legacy JSON database"""
+        try:
+            with open(legacy_json_path, 'r') as f:
+                legacy = json.load(f)
+            for file_id, data in legacy.items():
+                self._entries[file_id] = FileRecord.from_dict(data)
+            self.save()
+            logger.info(f"Migrated {len(legacy)} records from {legacy_json_path}")
+        except Exception as e:
+            logger.error(f"Error migrating files database: {e}")
+
+    def _raw_entry(self, offset):
+        """Return the raw bytes of the entry starting at offset"""
+        payload_len, key_len = _ENTRY.unpack_from(self._buf, offset)
+        return self._buf[offset:offset + _ENTRY.size + key_len + payload_len]
+
+    def __getitem__(self, file_id):
+        value = self._entries[file_id]
+        if isinstance(value, int):
+            with self._lock:
+                value = self._entries[file_id]
+                if isinstance(value, int):
+                    _, key_len = _ENTRY.unpack_from(self._buf, value)
+                    value = decode_record(self._buf, value + _ENTRY.size + key_len)
+                    self._entries[file_id] = value
+        return value
+
+    def __setitem__(self, file_id, record):
+        self._entries[file_id] = record
+
+    def __delitem__(self, file_id):
+        del self._entries[file_id]
+
+    def __iter__(self):
+        return iter(list(self._entries))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, file_id):
+        return file_id in self._entries
+
+    def records(self):
+        """
+        Iterate over (file_id, FileRecord) without caching decoded records
+
+        Records that are not in memory yet are decoded for the caller only,
+        so a full scan leaves the store lazy and later saves keep copying
+        their bytes.
+        """
+        for file_id in self:
+            with self._lock:
+                value = self._entries.get(file_id)
+                if isinstance(value, int):
+                    _, key_len = _ENTRY.unpack_from(self._buf, value)
+                    value = decode_record(self._buf, value + _ENTRY.size + key_len)
+            if value is not None:
+                yield file_id, value
+
+    def scan(self, names):
+        """
+        Iterate over (file_id, dict of selected fields) without caching
+
+        Args:
+            names: FileRecord field names to read
+
+        Yields:
+            tuple: file_id and a dict of the named fields
+        """
+        names = tuple(names)
+        for file_id in self:
+            with self._lock:
+                value = self._entries.get(file_id)
+                if isinstance(value, int):
+                    key_len = _ENTRY.unpack_from(self._buf, value)[1]
+                    values = decode_fields(self._buf, value + _ENTRY.size + key_len, names)
+                elif value is not None:
+                    values = {name: getattr(value, name) for name in names}
+            if value is not None:
+                yield file_id, values
+
+    def save(self):
+        """Atomically write all records to the binary store"""
+        with self._lock:
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(_HEADER.pack(MAGIC, SCHEMA_VERSION, len(self._entries)))
+                for file_id, value in self._entries.items():
+                    if isinstance(value, int):
+                        f.write(self._raw_entry(value))
+                        continue
+                    key = file_id.encode('utf-8')
+                    payload = encode_record(value)
+                    f.write(_ENTRY.pack(len(payload), len(key)))
+                    f.write(key)
+                    f.write(payload)
+            os.replace(tmp_path, self.path)
+
+            # Point undecoded entries at their offsets in the new file
+            self._load()
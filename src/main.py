@@ -4,11 +4,34 @@ import uuid
 import json
 import logging
 import datetime
-from flask import Flask, render_template, request, redirect, url_for, jsonify, send_file
+import dataclasses
+from flask import Flask, Response, render_template, request, redirect, url_for, jsonify, send_file
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.middleware.proxy_fix import ProxyFix
+from src import logging_config
+
+# Configure logging before the services below log during initialization
+logging_config.configure_logging()
+
 from src.oid4vp.qr_code import generate_qr_code, create_presentation_request
 from src.oid4vp.signature import SwiyuSignatureService
+from src.oid4vp.request_refs import create_request_reference, resolve_request_reference
 from src.threema_service import ThreemaService
+from src.verification_service import BulkVerificationService, parse_manifest
+from src import storage, chunk_store, tracing, bundles
+from src.admission import AdmissionController
+from src.asset_pipeline import AssetPipeline
+from src.file_store import FileStore
+from src.transparency_log import TransparencyLog, entry_bytes
+from src.share_links import ShareLinkService, InvalidLink, SHARE, VERIFY
+from src.preview_service import PreviewService, PreviewUnavailable, PreviewBusy, PREVIEW_MIMETYPE
+from src.models.file_record import FileRecord, FileStatus, SignatureRecord
+from src.models.user import User, db
+from src.models.file_index import FileEntry
+from src.routes.user import user_bp
+from src.routes.files import files_bp
+from src.routes.auth import LISTING_API_TOKEN
 
 # Set up path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
@@ -17,8 +40,8 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Assign request IDs and log timed access records
+logging_config.init_app(app)
 logger = logging.getLogger(__name__)
 
 # Configure upload folder
@@ -28,23 +51,110 @@ if not os.path.exists(UPLOAD_FOLDER):
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max upload
 
+@app.before_request
+def hide_uploads():
+    """Keep the uploads disk out of /static; files are only served by the token-checked routes"""
+    if request.endpoint == 'static':
+        path = os.path.normpath(request.view_args.get('filename', '')).replace(os.sep, '/')
+        if path == 'uploads' or path.startswith('uploads/'):
+            return "Not found", 404
+
+# Database for users and the queryable file index
+DATABASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.db')
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', f"sqlite:///{DATABASE_PATH}")
+db.init_app(app)
+
+# Listings and user management are only served to holders of LISTING_API_TOKEN;
+# without it they stay off
+if LISTING_API_TOKEN:
+    app.register_blueprint(user_bp, url_prefix='/api')
+    app.register_blueprint(files_bp, url_prefix='/api')
+
+# Trust X-Forwarded-For from the reverse proxy so rate limits apply per client
+TRUSTED_PROXY_COUNT = int(os.getenv('TRUSTED_PROXY_COUNT', '1'))
+if TRUSTED_PROXY_COUNT:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_COUNT)
+
+# Build fingerprinted CSS/JS bundles and expose asset_url() to templates
+asset_pipeline = AssetPipeline()
+asset_pipeline.init_app(app)
+
 # Initialize services
 threema_service = ThreemaService()
 signature_service = SwiyuSignatureService()
+bulk_verification_service = BulkVerificationService(signature_service)
+
+# First-page previews rendered on a process pool and cached by content digest
+preview_service = PreviewService()
+
+# Signed, expiring share and verify links
+share_links = ShareLinkService()
 
-# Store file metadata
-files_db = {}
+# Append-only log of every signature, with batched signed tree heads
+transparency_log = TransparencyLog()
 
-# File database path
-FILES_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'files_db.json')
+# Maximum number of files accepted by a single bulk verification request
+BULK_VERIFY_MAX_FILES = int(os.getenv('BULK_VERIFY_MAX_FILES', '5000'))
 
-# Load file metadata from JSON if exists
-if os.path.exists(FILES_DB_PATH):
+# Admission control: per-client and per-file rates ("count/seconds") and upload capacity
+admission = AdmissionController()
+UPLOAD_RATE = os.getenv('ADMISSION_UPLOAD_RATE', '10/60')
+PRESENTATION_REQUEST_RATE = os.getenv('ADMISSION_REQUEST_RATE', '30/60')
+PRESENTATION_REQUEST_FILE_RATE = os.getenv('ADMISSION_REQUEST_FILE_RATE', '10/60')
+CALLBACK_RATE = os.getenv('ADMISSION_CALLBACK_RATE', '30/60')
+CALLBACK_FILE_RATE = os.getenv('ADMISSION_CALLBACK_FILE_RATE', '5/60')
+MAX_CONCURRENT_UPLOADS = int(os.getenv('ADMISSION_MAX_UPLOADS', '4'))
+MAX_BUFFERED_UPLOAD_BYTES = int(os.getenv('ADMISSION_MAX_UPLOAD_BYTES', str(256 * 1024 * 1024)))
+
+def file_id_from_url(view_args):
+    """Admission key for routes with a file_id URL parameter"""
+    file_id = view_args.get('file_id')
+    # Unknown IDs get no bucket of their own, so random IDs cannot grow the store
+    return file_id if file_id in files_db else None
+
+def file_id_from_token(view_args):
+    """Admission and trace key for routes with a verify token URL parameter"""
+    try:
+        file_id = share_links.check(view_args.get('token', ''), VERIFY)['file_id']
+    except InvalidLink:
+        return None
+    return file_id if file_id in files_db else None
+
+def file_id_from_state(view_args):
+    """Admission key for wallet callbacks, taken from the state parameter"""
+    data = request.get_json(silent=True) or {}
+    file_id = str(data.get('state', '')).split('_')[-1]
+    return file_id if file_id in files_db else None
+
+# File database paths; the legacy JSON database is migrated on first start
+FILES_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'files_db.bin')
+LEGACY_FILES_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'files_db.json')
+
+# Store file metadata, loaded lazily from the binary database
+try:
+    files_db = FileStore(FILES_DB_PATH, LEGACY_FILES_DB_PATH)
+except Exception as e:
+    logger.error(f"Error loading files database: {e}")
+    # Keep the unreadable database for inspection and start with an empty one
+    os.replace(FILES_DB_PATH, FILES_DB_PATH + '.corrupt')
+    files_db = FileStore(FILES_DB_PATH)
+
+def index_file(*file_ids):
+    """Mirror file records into the queryable file index"""
     try:
-        with open(FILES_DB_PATH, 'r') as f:
-            files_db = json.load(f)
+        for file_id in file_ids:
+            db.session.merge(FileEntry.from_record(file_id, files_db[file_id]))
+        db.session.commit()
     except Exception as e:
-        logger.error(f"Error loading files database: {e}")
+        db.session.rollback()
+        logger.error(f"Error indexing files {', '.join(file_ids)}: {e}")
+
+# Create the tables and backfill the index when it is first introduced
+with app.app_context():
+    db.create_all()
+    if len(files_db) and not db.session.query(FileEntry.id).first():
+        db.session.add_all(FileEntry.from_record(file_id, record) for file_id, record in files_db.records())
+        db.session.commit()
 
 # Custom Jinja2 filter for datetime formatting
 @app.template_filter('datetime')
@@ -58,6 +168,9 @@ def index():
     return render_template('index.html')
 
 @app.route('/upload', methods=['POST'])
+@tracing.trace_route('upload')
+@admission.limit('upload', UPLOAD_RATE, pool='upload',
+                 max_concurrent=MAX_CONCURRENT_UPLOADS, max_bytes=MAX_BUFFERED_UPLOAD_BYTES)
 def upload_file():
     try:
         # Check if the post request has the file part
@@ -70,39 +183,238 @@ def upload_file():
         if file.filename == '':
             return jsonify({'error': 'No selected file'}), 400
         
+        # Optional owning user; an empty field means none
+        owner_id = request.form.get('owner_id') or None
+        if owner_id is not None:
+            owner_id = int(owner_id) if owner_id.isdigit() else None
+            if owner_id is None or db.session.get(User, owner_id) is None:
+                return jsonify({'error': 'Owner not found'}), 400
+        
+        # Optional existing file this upload is a new version of; only the
+        # holder of its share link may replace the current version
+        base_id = request.form.get('file_id')
+        if base_id is not None:
+            if base_id not in files_db:
+                return jsonify({'error': 'File not found'}), 404
+            if share_token_file(request.form.get('token', '')) != base_id:
+                return jsonify({'error': 'A share link of the file is required'}), 403
+        tracing.set_file(base_id)
+        
+        if file and base_id:
+            filename = secure_filename(file.filename)
+            content_type = storage.guess_content_type(filename, file.mimetype)
+            return add_version(base_id, file.stream, filename, content_type)
+        
         if file:
             # Generate a unique ID for the file
             file_id = str(uuid.uuid4())
+            tracing.set_file(file_id)
             
             # Secure the filename and save the file
             filename = secure_filename(file.filename)
             file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{file_id}_{filename}")
             
-            # Ensure the upload directory exists
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            
-            file.save(file_path)
+            # Store the file, compressing compressible content in the same pass
+            content_type = storage.guess_content_type(filename, file.mimetype)
+            with tracing.span('storage.save', content_type=content_type) as span:
+                stored = storage.save_upload(file.stream, file_path, content_type)
+                span.set(size=stored['size'], stored_size=stored['stored_size'], encoding=stored['encoding'])
             
             # Store file metadata
-            files_db[file_id] = {
-                'filename': filename,
-                'path': file_path,
-                'size': os.path.getsize(file_path),
-                'timestamp': int(datetime.datetime.now().timestamp()),
-                'status': 'uploaded',
-                'signature': None
-            }
+            files_db[file_id] = FileRecord(
+                filename=filename,
+                timestamp=int(datetime.datetime.now().timestamp()),
+                owner_id=owner_id,
+                **stored
+            )
             
             # Save the updated files database
-            with open(FILES_DB_PATH, 'w') as f:
-                json.dump(files_db, f)
+            with tracing.span('files_db.save'):
+                files_db.save()
+                index_file(file_id)
             
-            return jsonify({'success': True, 'file_id': file_id}), 200
+            # The uploader's link to share, download and preview the file
+            share_token, _ = share_links.issue(file_id, (SHARE, VERIFY))
+            return jsonify({
+                'success': True,
+                'file_id': file_id,
+                'share_token': share_token,
+                'sign_url': url_for('sign_file', file_id=file_id, token=share_token)
+            }), 200
     except Exception as e:
         logger.error(f"Error in upload_file: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/upload/bundle', methods=['POST'])
+@tracing.trace_route('upload_bundle')
+@admission.limit('upload', UPLOAD_RATE, pool='upload',
+                 max_concurrent=MAX_CONCURRENT_UPLOADS, max_bytes=MAX_BUFFERED_UPLOAD_BYTES)
+def upload_bundle():
+    """Upload several files in one request, streaming each part straight to storage"""
+    try:
+        boundary = request.mimetype_params.get('boundary')
+        if request.mimetype != 'multipart/form-data' or not boundary:
+            return jsonify({'error': 'Expected multipart/form-data'}), 400
+        
+        # Files are stored while the body is read, before any form field is seen
+        fields, stored_files = bundles.save_parts(request.stream, boundary, app.config['UPLOAD_FOLDER'])
+        if not stored_files:
+            return jsonify({'error': 'No files uploaded'}), 400
+        
+        # Optional owning user of all files; an empty field means none, as for /upload
+        owner_id = fields.get('owner_id') or None
+        if owner_id is not None:
+            owner_id = int(owner_id) if owner_id.isdigit() else None
+            if owner_id is None or db.session.get(User, owner_id) is None:
+                for _, _, stored in stored_files:
+                    os.remove(stored['path'])
+                return jsonify({'error': 'Owner not found'}), 400
+        
+        # A bundle upload is traced under its first file
+        tracing.set_file(stored_files[0][0])
+        
+        timestamp = int(datetime.datetime.now().timestamp())
+        for file_id, filename, stored in stored_files:
+            files_db[file_id] = FileRecord(
+                filename=filename,
+                timestamp=timestamp,
+                owner_id=owner_id,
+                **stored
+            )
+        
+        with tracing.span('files_db.save', files=len(stored_files)):
+            files_db.save()
+            index_file(*(file_id for file_id, _, _ in stored_files))
+        
+        return jsonify({
+            'success': True,
+            'file_ids': [file_id for file_id, _, _ in stored_files],
+            'files': [
+                {'file_id': file_id, 'filename': filename, 'size': stored['size'],
+                 'share_token': share_links.issue(file_id, (SHARE, VERIFY))[0]}
+                for file_id, filename, stored in stored_files
+            ]
+        }), 200
+    except bundles.BundleError as e:
+        return jsonify({'error': str(e)}), 400
+    except RequestEntityTooLarge:
+        return jsonify({'error': 'Upload too large'}), 413
+    except Exception as e:
+        logger.error(f"Error in upload_bundle: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def add_version(file_id, stream, filename, content_type):
+    """Store an upload as the next version of an existing file"""
+    file_data = files_db[file_id]
+    
+    # Move a whole-file version into the chunk store first so versions share chunks
+    old_path = None
+    if not file_data.manifest:
+        with tracing.span('storage.migrate', size=file_data.size), storage.open_original(file_data) as original:
+            migrated = storage.save_version(
+                original, file_data.content_type or storage.guess_content_type(file_data.filename)
+            )
+        old_path = file_data.path
+        file_data = dataclasses.replace(
+            file_data, manifest=migrated['manifest'], sha256=migrated['sha256'],
+            path='', encoding=None, stored_size=migrated['stored_size']
+        )
+    
+    # Only chunks that differ from stored ones are written
+    with tracing.span('storage.save_version', content_type=content_type) as span:
+        stored = storage.save_version(stream, content_type)
+        chunks, new_chunks = stored.pop('chunks'), stored.pop('new_chunks')
+        span.set(size=stored['size'], stored_size=stored['stored_size'], chunks=chunks, new_chunks=new_chunks)
+    
+    # The new version starts unsigned; earlier versions keep their signatures
+    files_db[file_id] = dataclasses.replace(
+        file_data,
+        filename=filename,
+        timestamp=int(datetime.datetime.now().timestamp()),
+        status=FileStatus.UPLOADED,
+        signature=None,
+        signer=None,
+        log_index=None,
+        version=file_data.version + 1,
+        versions=(file_data.versions or []) + [file_data.archive_version()],
+        **stored
+    )
+    files_db.save()
+    index_file(file_id)
+    
+    if old_path:
+        try:
+            os.remove(old_path)
+        except OSError as e:
+            logger.error(f"Error removing migrated file {old_path}: {e}")
+    
+    return jsonify({
+        'success': True,
+        'file_id': file_id,
+        'version': file_data.version + 1,
+        'chunks': chunks,
+        'new_chunks': new_chunks
+    }), 200
+
+@app.route('/api/files/<token>/versions')
+def file_versions(token):
+    """List the versions of a file a link gives access to, oldest first"""
+    try:
+        link = share_links.check(token, VERIFY)
+    except InvalidLink as e:
+        return jsonify({'error': str(e)}), e.status
+    file_id = link['file_id']
+    
+    if file_id not in files_db:
+        return jsonify({'error': 'File not found'}), 404
+    
+    file_data = files_db[file_id]
+    versions = []
+    for record in (file_data.versions or []) + [file_data]:
+        # Links bound to a version do not reveal later ones
+        if link['version'] is not None and record.version > link['version']:
+            continue
+        versions.append({
+            'version': record.version,
+            'filename': record.filename,
+            'size': record.size,
+            'timestamp': record.timestamp,
+            'sha256': record.sha256,
+            'status': record.status.value,
+            'signer': record.signer
+        })
+    return jsonify({'file_id': file_id, 'current': file_data.version, 'versions': versions}), 200
+
+def share_token_file(token):
+    """File ID a share token is valid for, or None"""
+    try:
+        return share_links.check(token, SHARE)['file_id']
+    except InvalidLink:
+        return None
+
+def linked_file(token):
+    """
+    Resolve a verify link to the file version it gives access to
+
+    Links handed to recipients are bound to the signed version they were
+    issued for, so a later upload never changes what they serve; the
+    uploader's own link follows the current version.
+
+    Returns:
+        tuple: (link, record) where link is the checked token and record the
+            FileRecord or VersionRecord, or None if the file or version is gone
+
+    Raises:
+        InvalidLink: If the token does not permit verifying
+    """
+    link = share_links.check(token, VERIFY)
+    file_data = files_db.get(link['file_id'])
+    if file_data is not None and link['version'] is not None:
+        file_data = file_data.get_version(link['version'])
+    return link, file_data
+
 @app.route('/sign/<file_id>')
+@tracing.trace_route('sign_page', file_id_from_url)
 def sign_file(file_id):
     # Check if file exists
     if file_id not in files_db:
@@ -110,22 +422,32 @@ def sign_file(file_id):
     
     file_data = files_db[file_id]
     
+    # The uploader's share link, if given, enables the preview and the share page
+    share_token = request.args.get('token')
+    if share_token and share_token_file(share_token) != file_id:
+        share_token = None
+    
     # Get the base URL for callbacks
     base_url = request.url_root.rstrip('/')
     
-    # Create presentation request for SWIYU app
-    auth_request = create_presentation_request(file_id, base_url)
+    # Create presentation request for SWIYU app, referenced by a short ID
+    auth_request = create_presentation_request(file_id, base_url, create_request_reference(file_id))
     
     # Generate QR code
-    qr_code = generate_qr_code(auth_request)
+    with tracing.span('qr_code'):
+        qr_code = generate_qr_code(auth_request)
     
     return render_template('sign.html', 
                           file_id=file_id, 
                           file_data=file_data, 
+                          share_token=share_token,
                           qr_code=qr_code,
                           swiyu_url=auth_request)
 
 @app.route('/api/presentation-request/<file_id>')
+@tracing.trace_route('presentation_request', file_id_from_url)
+@admission.limit('presentation-request', PRESENTATION_REQUEST_RATE,
+                 key_func=file_id_from_url, key_rate=PRESENTATION_REQUEST_FILE_RATE)
 def get_presentation_request(file_id):
     """Endpoint to get the presentation request JWT"""
     try:
@@ -144,7 +466,33 @@ def get_presentation_request(file_id):
         logger.error(f"Error in get_presentation_request: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/r/<ref_id>')
+@tracing.trace_route('resolve_request')
+@admission.limit('presentation-request', PRESENTATION_REQUEST_RATE)
+def resolve_presentation_request(ref_id):
+    """Resolve a short request reference from a QR code to the presentation request JWT"""
+    try:
+        file_id = resolve_request_reference(ref_id)
+        if file_id is None:
+            return jsonify({'error': 'Request not found or expired'}), 404
+        tracing.set_file(file_id)
+        
+        if file_id not in files_db:
+            return jsonify({'error': 'File not found'}), 404
+        
+        # Serve the request directly to save the wallet a redirect round trip
+        base_url = request.url_root.rstrip('/')
+        token = signature_service.create_presentation_request(file_id, base_url)
+        
+        return jsonify({'token': token}), 200
+    except Exception as e:
+        logger.error(f"Error in resolve_presentation_request: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/callback', methods=['POST'])
+@tracing.trace_route('callback', file_id_from_state)
+@admission.limit('callback', CALLBACK_RATE,
+                 key_func=file_id_from_state, key_rate=CALLBACK_FILE_RATE)
 def presentation_callback():
     """Callback endpoint for SWIYU app presentation responses"""
     try:
@@ -156,7 +504,8 @@ def presentation_callback():
         response_token = data['vp_token']
         
         # Verify the response
-        is_valid, claims = signature_service.verify_presentation_response(response_token)
+        with tracing.span('verify_presentation'):
+            is_valid, claims = signature_service.verify_presentation_response(response_token)
         
         if not is_valid:
             return jsonify({'error': 'Invalid token', 'details': claims}), 400
@@ -169,21 +518,34 @@ def presentation_callback():
         if file_id not in files_db:
             return jsonify({'error': 'File not found'}), 404
         
-        # Get the file path
-        file_path = files_db[file_id]['path']
-        
-        # Sign the file
+        # Sign the file, hashing the original rather than the stored bytes
         holder_did = claims.get('sub', 'unknown')
-        signature = signature_service.sign_file(file_path, holder_did)
+        with tracing.span('digest', size=files_db[file_id].size, reused=bool(files_db[file_id].manifest)):
+            if files_db[file_id].manifest:
+                # Chunked versions were hashed in the same pass that chunked them,
+                # and their content-addressed chunks cannot change afterwards
+                digest = bytes.fromhex(files_db[file_id].sha256)
+            else:
+                with storage.open_original(files_db[file_id]) as stream:
+                    digest = signature_service.compute_stream_digest(stream)
+        with tracing.span('sign_digest'):
+            signature = signature_service.sign_digest(digest, holder_did)
         
         # Update file metadata
-        files_db[file_id]['status'] = 'signed'
-        files_db[file_id]['signature'] = signature
-        files_db[file_id]['signer'] = holder_did
+        file_data = files_db[file_id]
+        file_data.status = FileStatus.SIGNED
+        file_data.signature = SignatureRecord.from_dict(signature)
+        file_data.signer = holder_did
+        
+        # Record the signature in the transparency log
+        with tracing.span('transparency_log.append') as span:
+            file_data.log_index = transparency_log.append(entry_bytes(file_id, file_data.signature.to_dict()))
+            span.set(log_index=file_data.log_index)
         
         # Save the updated files database
-        with open(FILES_DB_PATH, 'w') as f:
-            json.dump(files_db, f)
+        with tracing.span('files_db.save'):
+            files_db.save()
+            index_file(file_id)
         
         return jsonify({'success': True}), 200
     except Exception as e:
@@ -199,16 +561,29 @@ def signature_status(file_id):
             return jsonify({'error': 'File not found'}), 404
         
         # Get the file status
-        status = files_db[file_id]['status']
+        status = files_db[file_id].status
+        result = {'status': status.value}
+        
+        # Point the uploader's own share link at the share page once the file
+        # is signed; the file ID alone never yields a link
+        token = request.args.get('token')
+        if status == FileStatus.SIGNED and token and share_token_file(token) == file_id:
+            result['share_url'] = url_for('share_file', token=token)
         
-        return jsonify({'status': status}), 200
+        return jsonify(result), 200
     except Exception as e:
         logger.error(f"Error in signature_status: {e}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/share/<file_id>')
-def share_file(file_id):
+@app.route('/share/<token>')
+def share_file(token):
     """Page to share a signed file"""
+    # Reject invalid or expired links before looking up the file
+    try:
+        file_id = share_links.check(token, SHARE)['file_id']
+    except InvalidLink as e:
+        return str(e), e.status
+    
     # Check if file exists
     if file_id not in files_db:
         return "File not found", 404
@@ -216,81 +591,136 @@ def share_file(file_id):
     file_data = files_db[file_id]
     
     # Check if file is signed
-    if file_data['status'] != 'signed':
+    if file_data.status != FileStatus.SIGNED:
         return "File is not signed yet", 400
     
-    # Get the base URL for sharing
-    base_url = request.url_root.rstrip('/')
-    verification_url = f"{base_url}/verify/{file_id}"
+    # Verification link for sharing by hand
+    verify_token, _ = share_links.issue(file_id, (VERIFY,), version=file_data.version)
+    verification_url = url_for('verify_file', token=verify_token, _external=True)
     
     return render_template('share.html', 
-                          file_id=file_id, 
                           file_data=file_data,
+                          share_token=token,
                           verification_url=verification_url)
 
-@app.route('/api/send-link/<file_id>', methods=['POST'])
-def send_link(file_id):
+@app.route('/api/send-link/<token>', methods=['POST'])
+@tracing.trace_route('send_link')
+def send_link(token):
     """Send a verification link via Threema"""
     try:
+        try:
+            file_id = share_links.check(token, SHARE)['file_id']
+        except InvalidLink as e:
+            return jsonify({'error': str(e)}), e.status
+        tracing.set_file(file_id)
+        
         # Check if file exists
         if file_id not in files_db:
             return jsonify({'error': 'File not found'}), 404
         
+        # Only signed files are sent; a new version starts out unsigned
+        if files_db[file_id].status != FileStatus.SIGNED:
+            return jsonify({'error': 'File is not signed yet'}), 400
+        
         # Get the Threema ID from the request
         data = request.json
         if not data or 'threema_id' not in data:
             return jsonify({'error': 'Threema ID is required'}), 400
         
         threema_id = data['threema_id']
+        mode = data.get('mode', 'link')
+        if mode not in ('link', 'file'):
+            return jsonify({'error': 'Mode must be link or file'}), 400
         
-        # Get the base URL for sharing
-        base_url = request.url_root.rstrip('/')
-        verification_url = f"{base_url}/verify/{file_id}"
+        # Issue a distinct, revocable link for this recipient
+        verify_token, link_id = share_links.issue(file_id, (VERIFY,), recipient=threema_id,
+                                                  version=files_db[file_id].version)
+        verification_url = url_for('verify_file', token=verify_token, _external=True)
         
         # Get the file name
-        filename = files_db[file_id]['filename']
+        filename = files_db[file_id].filename
         
-        # Send the link via Threema
-        message = f"You have received a signed file: {filename}. Verify and download it here: {verification_url}"
-        result = threema_service.send_message(threema_id, message)
+        if mode == 'file':
+            # Deliver the file itself end-to-end encrypted, with the link to verify it
+            caption = f"Signed file: {filename}. Verify it here: {verification_url}"
+            with tracing.span('threema.send_file', size=files_db[file_id].size):
+                result = threema_service.send_file(threema_id, files_db[file_id], caption)
+        else:
+            # Send the link via Threema
+            message = f"You have received a signed file: {filename}. Verify and download it here: {verification_url}"
+            with tracing.span('threema.send_message'):
+                result = threema_service.send_message(threema_id, message)
         
         if result['success']:
-            return jsonify({'success': True}), 200
+            return jsonify({'success': True, 'link_id': link_id}), 200
         else:
             return jsonify({'error': result['error']}), 500
     except Exception as e:
         logger.error(f"Error in send_link: {e}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/verify/<file_id>')
-def verify_file(file_id):
+@app.route('/api/revoke-link/<token>', methods=['POST'])
+def revoke_link(token):
+    """Revoke a verification link sent to a recipient"""
+    try:
+        try:
+            file_id = share_links.check(token, SHARE)['file_id']
+        except InvalidLink as e:
+            return jsonify({'error': str(e)}), e.status
+        
+        data = request.get_json(silent=True) or {}
+        if not data.get('link_id'):
+            return jsonify({'error': 'Link ID is required'}), 400
+        
+        # Only links sent for the file of this share link can be revoked
+        share_links.revoke(file_id, data['link_id'])
+        return jsonify({'success': True}), 200
+    except InvalidLink as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        logger.error(f"Error in revoke_link: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/verify/<token>')
+def verify_file(token):
     """Page to verify and download a signed file"""
+    # Reject invalid, expired or revoked links before looking up the file
+    try:
+        link, file_data = linked_file(token)
+    except InvalidLink as e:
+        return str(e), e.status
+    file_id = link['file_id']
+    
     # Check if file exists
-    if file_id not in files_db:
+    if file_data is None:
         return "File not found", 404
     
-    file_data = files_db[file_id]
-    
     # Check if file is signed
-    if file_data['status'] != 'signed':
+    if file_data.status != FileStatus.SIGNED:
         return "File is not signed", 400
     
     # Get the base URL for callbacks
     base_url = request.url_root.rstrip('/')
     
-    # Create presentation request for verification
-    auth_request = create_presentation_request(file_id, base_url)
+    # Create presentation request for verification, referenced by a short ID
+    auth_request = create_presentation_request(file_id, base_url, create_request_reference(file_id))
     
     # Generate QR code
     qr_code = generate_qr_code(auth_request)
     
+    # Only offer the download once the signature checks out
+    is_valid = bulk_verification_service.verify_one(file_id, file_data).get('valid', False)
+    
+    # The page links downloads and previews through the token, never the file ID
     return render_template('verify.html', 
-                          file_id=file_id, 
+                          token=token, 
                           file_data=file_data,
+                          is_valid=is_valid,
                           qr_code=qr_code,
                           swiyu_url=auth_request)
 
 @app.route('/api/verify-signature/<file_id>', methods=['POST'])
+@tracing.trace_route('verify_signature', file_id_from_url)
 def verify_signature(file_id):
     """Verify a file signature"""
     try:
@@ -301,64 +731,254 @@ def verify_signature(file_id):
         file_data = files_db[file_id]
         
         # Check if file is signed
-        if file_data['status'] != 'signed' or not file_data.get('signature'):
+        if file_data.status != FileStatus.SIGNED or not file_data.signature:
             return jsonify({'error': 'File is not signed'}), 400
         
-        # Get the file path
-        file_path = file_data['path']
+        # Verify the signature, reusing the cached verdict if nothing changed
+        result = bulk_verification_service.verify_one(file_id, file_data)
+        if 'error' in result:
+            return jsonify({'error': result['error']}), 500
         
-        # Verify the signature
-        is_valid = signature_service.verify_file_signature(file_path, file_data['signature'])
+        if not result['valid']:
+            return jsonify({'error': 'Invalid signature'}), 400
         
-        if is_valid:
-            return jsonify({'success': True, 'signer': file_data.get('signer', 'unknown')}), 200
+        # Prove the signature was logged, checking the entry against the current record
+        if file_data.log_index is None:
+            transparency = {'status': 'unlogged'}
         else:
-            return jsonify({'error': 'Invalid signature'}), 400
+            transparency = transparency_log.inclusion_proof(
+                file_data.log_index, entry_bytes(file_id, file_data.signature.to_dict())
+            )
+        
+        return jsonify({
+            'success': True,
+            'signer': file_data.signer or 'unknown',
+            'transparency': transparency
+        }), 200
     except Exception as e:
         logger.error(f"Error in verify_signature: {e}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/download/<file_id>')
-def download_file(file_id):
-    """Download a file"""
+@app.route('/api/transparency-log')
+def transparency_log_head():
+    """Latest signed tree head and the key to check its signature"""
+    return jsonify({
+        'tree_head': transparency_log.latest_head(),
+        'tree_size': transparency_log.size(),
+        'public_key': transparency_log.public_key_pem
+    })
+
+@app.route('/api/verify-signatures', methods=['POST'])
+def verify_signatures():
+    """Verify many file signatures, streaming results as NDJSON"""
+    try:
+        # File IDs come either from an uploaded manifest or a JSON body
+        if 'manifest' in request.files:
+            file_ids = parse_manifest(request.files['manifest'].read())
+        else:
+            data = request.get_json(silent=True)
+            if not data or not isinstance(data.get('file_ids'), list):
+                return jsonify({'error': 'file_ids list or manifest is required'}), 400
+            file_ids = [str(file_id) for file_id in data['file_ids']]
+        
+        # Drop duplicates while keeping the requested order
+        file_ids = list(dict.fromkeys(file_ids))
+        
+        if not file_ids:
+            return jsonify({'error': 'No file IDs given'}), 400
+        if len(file_ids) > BULK_VERIFY_MAX_FILES:
+            return jsonify({'error': f'At most {BULK_VERIFY_MAX_FILES} files per request'}), 400
+        
+        def generate():
+            for result in bulk_verification_service.verify_many(file_ids, files_db.get):
+                yield json.dumps(result) + '\n'
+        
+        return Response(generate(), mimetype='application/x-ndjson')
+    except ValueError as e:
+        return jsonify({'error': f'Invalid manifest: {e}'}), 400
+    except Exception as e:
+        logger.error(f"Error in verify_signatures: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/download/bundle')
+@tracing.trace_route('download_bundle')
+def download_bundle():
+    """Download several files with their signature manifests as one streamed ZIP"""
+    tokens = request.args.getlist('token')
+    if not tokens:
+        return jsonify({'error': 'At least one token is required'}), 400
+    if len(tokens) > bundles.BUNDLE_MAX_FILES:
+        return jsonify({'error': f'At most {bundles.BUNDLE_MAX_FILES} files per bundle'}), 400
+    
+    # Every file needs its own verify link, which also selects its version
+    linked = {}
+    for token in tokens:
+        try:
+            link, file_data = linked_file(token)
+        except InvalidLink as e:
+            return jsonify({'error': str(e)}), e.status
+        if file_data is None:
+            return jsonify({'error': 'File not found'}), 404
+        # Drop duplicates while keeping the requested order
+        linked.setdefault((link['file_id'], file_data.version), (link['file_id'], file_data))
+    files = list(linked.values())
+    
+    # A bundle download is traced under its first file
+    tracing.set_file(files[0][0])
+    
+    # The archive is built while it is sent, so its length is not known up front
+    return Response(bundles.stream_zip(files), mimetype='application/zip', headers={
+        'Content-Disposition': 'attachment; filename="bundle.zip"'
+    })
+
+@app.route('/download/<token>')
+@tracing.trace_route('download', file_id_from_token)
+def download_file(token):
+    """Download a file through its verify link"""
+    try:
+        link, file_data = linked_file(token)
+    except InvalidLink as e:
+        return str(e), e.status
+    
     # Check if file exists
-    if file_id not in files_db:
+    if file_data is None:
         return "File not found", 404
     
-    file_data = files_db[file_id]
+    # Earlier versions are selected by number; links bound to a version only serve that one
+    version = request.args.get('version', type=int)
+    if version is not None and version != file_data.version:
+        file_data = files_db[link['file_id']].get_version(version) if link['version'] is None else None
+        if file_data is None:
+            return "Version not found", 404
+    
+    # Chunked versions are reassembled from their chunks
+    if file_data.manifest:
+        response = send_file(storage.open_original(file_data), as_attachment=True,
+                             download_name=file_data.filename, mimetype=file_data.content_type,
+                             conditional=False)
+        response.content_length = file_data.size
+        return response
     
     # Get the file path
-    file_path = file_data['path']
+    file_path = file_data.path
+    content_type = file_data.content_type
+    encoding = file_data.encoding
+    
+    # Raw files are sent as-is
+    if not encoding:
+        return send_file(file_path, as_attachment=True, download_name=file_data.filename,
+                         mimetype=content_type)
     
-    # Send the file
-    return send_file(file_path, as_attachment=True, download_name=file_data['filename'])
+    # Serve the stored compressed bytes directly if the client can decode them
+    if storage.accepts_encoding(request.headers.get('Accept-Encoding', ''), encoding):
+        response = send_file(file_path, as_attachment=True, download_name=file_data.filename,
+                             mimetype=content_type)
+        response.headers['Content-Encoding'] = encoding
+    else:
+        # Otherwise decompress on the fly
+        response = send_file(storage.open_original(file_data), as_attachment=True,
+                             download_name=file_data.filename, mimetype=content_type,
+                             conditional=False)
+        response.content_length = file_data.size
+    
+    response.vary.add('Accept-Encoding')
+    return response
+
+@app.route('/preview/<token>')
+@tracing.trace_route('preview', file_id_from_token)
+def preview_file(token):
+    """Thumbnail of the first page of a file, through its verify link"""
+    try:
+        _, file_data = linked_file(token)
+    except InvalidLink as e:
+        return str(e), e.status
+    
+    # Check if file exists
+    if file_data is None:
+        return "File not found", 404
+    
+    # Legacy records are hashed on their first preview and keep the digest
+    unhashed = not file_data.sha256
+    try:
+        path, digest = preview_service.get(file_data)
+    except PreviewUnavailable as e:
+        return str(e), 404
+    except PreviewBusy as e:
+        return str(e), 503, {'Retry-After': '2'}
+    finally:
+        if unhashed and file_data.sha256:
+            files_db.save()
+    
+    # Previews are keyed by content, so the digest is a strong validator
+    response = send_file(path, mimetype=PREVIEW_MIMETYPE, etag=digest, max_age=3600)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
+
+@app.route('/debug/trace/<file_id>')
+def trace_view(file_id):
+    """Waterfall of the recorded spans of a file, from upload to delivery"""
+    if not tracing.TRACE_DEBUG_VIEW:
+        return "Not found", 404
+    
+    spans = tracing.load_trace(file_id)
+    if request.args.get('format') == 'json':
+        return jsonify({'trace_id': tracing.trace_id_for(file_id), 'spans': spans}), 200
+    
+    return render_template('trace.html',
+                          file_id=file_id,
+                          trace_id=tracing.trace_id_for(file_id),
+                          trace=tracing.waterfall(spans))
 
 # Cleanup task for files older than 24 hours
 def cleanup_old_files():
     """Remove files older than 24 hours"""
     now = datetime.datetime.now().timestamp()
     files_to_remove = []
+    live_manifests = set()
+    live_digests = set()
     
-    for file_id, file_data in files_db.items():
+    # Read only the fields needed here, so records stay undecoded in the store
+    for file_id, file_data in files_db.scan(('timestamp', 'path', 'manifest', 'sha256', 'versions')):
         # Check if file is older than 24 hours
         if now - file_data['timestamp'] > 24 * 60 * 60:
-            # Remove the file
+            # Remove the file; chunks are swept below once unreferenced
             try:
-                os.remove(file_data['path'])
+                if not file_data['manifest']:
+                    os.remove(file_data['path'])
                 files_to_remove.append(file_id)
             except Exception as e:
                 logger.error(f"Error removing file {file_id}: {e}")
+        else:
+            if file_data['manifest']:
+                live_manifests.add(file_data['manifest'])
+                live_manifests.update(version.manifest for version in file_data['versions'] or ())
+            live_digests.add(file_data['sha256'])
+            live_digests.update(version.sha256 for version in file_data['versions'] or ())
     
     # Remove the files from the database
     for file_id in files_to_remove:
-        files_db.pop(file_id, None)
+        if file_id in files_db:
+            del files_db[file_id]
     
     # Save the updated files database
-    with open(FILES_DB_PATH, 'w') as f:
-        json.dump(files_db, f)
+    if files_to_remove:
+        files_db.save()
+    
+    # Delete chunks no remaining version refers to
+    chunk_store.collect_garbage(live_manifests)
+    
+    # Delete previews of files that are gone
+    preview_service.collect_garbage(live_digests)
+    
+    # Drop the removed files from the file index
+    if files_to_remove:
+        FileEntry.query.filter(FileEntry.id.in_(files_to_remove)).delete(synchronize_session=False)
+        db.session.commit()
 
 # Run cleanup task on startup
-cleanup_old_files()
+with app.app_context():
+    cleanup_old_files()
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,55 @@
+from src.models.user import db
+
+class FileEntry(db.Model):
+    """
+    Queryable index of uploaded files
+
+    The FileStore remains the source of truth for file metadata; this table
+    holds the columns needed to list files by owner, signer and status.
+    """
+    __tablename__ = 'file_entry'
+
+    id = db.Column(db.String(36), primary_key=True)
+    owner_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'), nullable=True)
+    filename = db.Column(db.String(255), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    status = db.Column(db.String(16), nullable=False)
+    signer = db.Column(db.String(255), nullable=True)
+    timestamp = db.Column(db.Integer, nullable=False)
+
+    owner = db.relationship('User', backref=db.backref('files', lazy='dynamic'))
+
+    # Composite indexes end in id so keyset pagination on (timestamp, id) is index-only
+    __table_args__ = (
+        db.Index('ix_file_entry_owner_timestamp', 'owner_id', 'timestamp', 'id'),
+        db.Index('ix_file_entry_signer_timestamp', 'signer', 'timestamp', 'id'),
+        db.Index('ix_file_entry_status_timestamp', 'status', 'timestamp', 'id'),
+        db.Index('ix_file_entry_timestamp', 'timestamp', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<FileEntry {self.id}>'
+
+    def to_dict(self):
+        return {
+            'file_id': self.id,
+            'owner_id': self.owner_id,
+            'filename': self.filename,
+            'size': self.size,
+            'status': self.status,
+            'signer': self.signer,
+            'timestamp': self.timestamp
+        }
+
+    @classmethod
+    def from_record(cls, file_id, record):
+        """Build an index entry from a FileRecord"""
+        return cls(
+            id=file_id,
+            owner_id=record.owner_id,
+            filename=record.filename,
+            size=record.size,
+            status=record.status.value,
+            signer=record.signer,
+            timestamp=int(record.timestamp)
+        )
@@ -0,0 +1,401 @@
+import sys
+import struct
+import functools
+from enum import Enum
+from dataclasses import dataclass, fields
+from typing import List, Optional
+
+class FileStatus(str, Enum):
+    """Lifecycle status of an uploaded file"""
+    UPLOADED = 'uploaded'
+    SIGNED = 'signed'
+
+# Stable wire codes for FileStatus; never renumber existing entries
+_STATUS_CODES = [FileStatus.UPLOADED, FileStatus.SIGNED]
+
+@dataclass(slots=True)
+class SignatureRecord:
+    """Signature data produced by SwiyuSignatureService.sign_digest"""
+    file_hash: str
+    algorithm: str
+    signer: str
+    timestamp: int
+    signature_type: str
+
+    def to_dict(self):
+        return {
+            'file_hash': self.file_hash,
+            'algorithm': self.algorithm,
+            'signer': self.signer,
+            'timestamp': self.timestamp,
+            'signature_type': self.signature_type
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{f.name: data.get(f.name) for f in fields(cls)})
+
+@dataclass(slots=True)
+class VersionRecord:
+    """An earlier version of a file, kept when a new version is uploaded"""
+    version: int
+    filename: str
+    size: int
+    timestamp: float
+    sha256: str
+    manifest: str
+    content_type: Optional[str] = None
+    status: FileStatus = FileStatus.UPLOADED
+    signature: Optional[SignatureRecord] = None
+    signer: Optional[str] = None
+    log_index: Optional[int] = None
+
+    def to_dict(self):
+        data = {f.name: getattr(self, f.name) for f in fields(self)}
+        data['status'] = self.status.value
+        data['signature'] = self.signature.to_dict() if self.signature else None
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        values = {f.name: data[f.name] for f in fields(cls) if f.name in data}
+        values['status'] = FileStatus(data.get('status') or 'uploaded')
+        if data.get('signature'):
+            values['signature'] = SignatureRecord.from_dict(data['signature'])
+        return cls(**values)
+
+@dataclass(slots=True)
+class FileRecord:
+    """Metadata of an uploaded file"""
+    filename: str
+    path: str
+    size: int
+    timestamp: float
+    status: FileStatus = FileStatus.UPLOADED
+    signature: Optional[SignatureRecord] = None
+    signer: Optional[str] = None
+    stored_size: Optional[int] = None
+    encoding: Optional[str] = None
+    sha256: Optional[str] = None
+    content_type: Optional[str] = None
+    owner_id: Optional[int] = None
+    log_index: Optional[int] = None
+    # Current version number; earlier versions are kept in versions, oldest first
+    version: int = 1
+    # Chunk manifest of the current version, set instead of path when chunked
+    manifest: Optional[str] = None
+    versions: Optional[List[VersionRecord]] = None
+
+    def to_dict(self):
+        data = {f.name: getattr(self, f.name) for f in fields(self)}
+        data['status'] = self.status.value
+        data['signature'] = self.signature.to_dict() if self.signature else None
+        if self.versions:
+            data['versions'] = [version.to_dict() for version in self.versions]
+        return data
+
+    def archive_version(self):
+        """Snapshot the current version as a VersionRecord"""
+        return VersionRecord(
+            version=self.version,
+            filename=self.filename,
+            size=self.size,
+            timestamp=self.timestamp,
+            sha256=self.sha256,
+            manifest=self.manifest,
+            content_type=self.content_type,
+            status=self.status,
+            signature=self.signature,
+            signer=self.signer,
+            log_index=self.log_index
+        )
+
+    def get_version(self, version):
+        """Return the record of a version number, or None if unknown"""
+        if version == self.version:
+            return self
+        for record in self.versions or ():
+            if record.version == version:
+                return record
+        return None
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a record from a legacy files_db.json entry, ignoring unknown keys"""
+        values = {f.name: data[f.name] for f in fields(cls) if f.name in data}
+        values.setdefault('path', '')
+        values.setdefault('size', 0)
+        values.setdefault('timestamp', 0)
+        values['status'] = FileStatus(data.get('status') or 'uploaded')
+        if data.get('signature'):
+            values['signature'] = SignatureRecord.from_dict(data['signature'])
+        if data.get('versions'):
+            values['versions'] = [VersionRecord.from_dict(version) for version in data['versions']]
+        return cls(**values)
+
+# Binary encoding
+#
+# Values use the MessagePack wire format (nil, bool, int, float64, str,
+# array). A record is an array of its fields in declaration order; fields
+# added in later schema versions go at the end, so older files decode with
+# defaults for the missing trailing fields.
+
+# Version 2 added FileRecord.owner_id
+# Version 3 added FileRecord.log_index
+# Version 4 added FileRecord.version, manifest and versions
+SCHEMA_VERSION = 4
+
+_FILE_FIELDS = [f.name for f in fields(FileRecord)]
+_SIGNATURE_FIELDS = [f.name for f in fields(SignatureRecord)]
+_VERSION_FIELDS = [f.name for f in fields(VersionRecord)]
+
+def _pack(value, out):
+    """Append the MessagePack encoding of a value to a bytearray"""
+    if value is None:
+        out.append(0xc0)
+    elif value is True:
+        out.append(0xc3)
+    elif value is False:
+        out.append(0xc2)
+    elif isinstance(value, int):
+        if 0 <= value < 0x80:
+            out.append(value)
+        elif -32 <= value < 0:
+            out.append(value & 0xff)
+        elif value >= 0:
+            for tag, fmt, limit in ((0xcc, '>BB', 1 << 8), (0xcd, '>BH', 1 << 16),
+                                    (0xce, '>BI', 1 << 32), (0xcf, '>BQ', 1 << 64)):
+                if value < limit:
+                    out += struct.pack(fmt, tag, value)
+                    break
+            else:
+                raise OverflowError(value)
+        else:
+            for tag, fmt, limit in ((0xd0, '>Bb', 1 << 7), (0xd1, '>Bh', 1 << 15),
+                                    (0xd2, '>Bi', 1 << 31), (0xd3, '>Bq', 1 << 63)):
+                if value >= -limit:
+                    out += struct.pack(fmt, tag, value)
+                    break
+            else:
+                raise OverflowError(value)
+    elif isinstance(value, float):
+        out += struct.pack('>Bd', 0xcb, value)
+    elif isinstance(value, str):
+        data = value.encode('utf-8')
+        n = len(data)
+        if n < 32:
+            out.append(0xa0 | n)
+        elif n < 0x100:
+            out += struct.pack('>BB', 0xd9, n)
+        elif n < 0x10000:
+            out += struct.pack('>BH', 0xda, n)
+        else:
+            out += struct.pack('>BI', 0xdb, n)
+        out += data
+    elif isinstance(value, (list, tuple)):
+        n = len(value)
+        if n < 16:
+            out.append(0x90 | n)
+        else:
+            out += struct.pack('>BI', 0xdd, n)
+        for item in value:
+            _pack(item, out)
+    else:
+        raise TypeError(f"Cannot encode {type(value).__name__}")
+
+_INT_FORMATS = {
+    0xcc: '>B', 0xcd: '>H', 0xce: '>I', 0xcf: '>Q',
+    0xd0: '>b', 0xd1: '>h', 0xd2: '>i', 0xd3: '>q'
+}
+_STR_LENGTHS = {0xd9: '>B', 0xda: '>H', 0xdb: '>I'}
+_ARRAY_LENGTHS = {0xdc: '>H', 0xdd: '>I'}
+
+def _unpack(buf, pos):
+    """Decode one MessagePack value, returning (value, next position)"""
+    tag = buf[pos]
+    pos += 1
+    # Strings dominate file records, so they are checked first
+    if 0xa0 <= tag <= 0xbf:
+        n = tag & 0x1f
+        # Short strings such as content types repeat across records; share them
+        return sys.intern(str(buf[pos:pos + n], 'utf-8')), pos + n
+    if tag == 0xd9:
+        n = buf[pos]
+        return str(buf[pos + 1:pos + 1 + n], 'utf-8'), pos + 1 + n
+    if tag < 0x80:
+        return tag, pos
+    if tag == 0xc0:
+        return None, pos
+    if tag in _INT_FORMATS:
+        fmt = _INT_FORMATS[tag]
+        return struct.unpack_from(fmt, buf, pos)[0], pos + struct.calcsize(fmt)
+    if 0x90 <= tag <= 0x9f:
+        return _unpack_array(buf, pos, tag & 0x0f)
+    if tag >= 0xe0:
+        return tag - 0x100, pos
+    if tag == 0xc2:
+        return False, pos
+    if tag == 0xc3:
+        return True, pos
+    if tag == 0xcb:
+        return struct.unpack_from('>d', buf, pos)[0], pos + 8
+    if tag in _STR_LENGTHS:
+        fmt = _STR_LENGTHS[tag]
+        n = struct.unpack_from(fmt, buf, pos)[0]
+        pos += struct.calcsize(fmt)
+        return str(buf[pos:pos + n], 'utf-8'), pos + n
+    if tag in _ARRAY_LENGTHS:
+        fmt = _ARRAY_LENGTHS[tag]
+        n = struct.unpack_from(fmt, buf, pos)[0]
+        return _unpack_array(buf, pos + struct.calcsize(fmt), n)
+    raise ValueError(f"Unsupported encoding tag 0x{tag:02x}")
+
+def _unpack_array(buf, pos, n):
+    items = []
+    for _ in range(n):
+        item, pos = _unpack(buf, pos)
+        items.append(item)
+    return items, pos
+
+def _skip(buf, pos):
+    """Return the position after one MessagePack value without decoding it"""
+    tag = buf[pos]
+    pos += 1
+    if 0xa0 <= tag <= 0xbf:
+        return pos + (tag & 0x1f)
+    if tag < 0x80 or tag >= 0xe0 or tag in (0xc0, 0xc2, 0xc3):
+        return pos
+    if tag in _INT_FORMATS:
+        return pos + struct.calcsize(_INT_FORMATS[tag])
+    if tag == 0xcb:
+        return pos + 8
+    if tag in _STR_LENGTHS:
+        fmt = _STR_LENGTHS[tag]
+        return pos + struct.calcsize(fmt) + struct.unpack_from(fmt, buf, pos)[0]
+    if 0x90 <= tag <= 0x9f:
+        n = tag & 0x0f
+    elif tag in _ARRAY_LENGTHS:
+        fmt = _ARRAY_LENGTHS[tag]
+        n = struct.unpack_from(fmt, buf, pos)[0]
+        pos += struct.calcsize(fmt)
+    else:
+        raise ValueError(f"Unsupported encoding tag 0x{tag:02x}")
+    for _ in range(n):
+        pos = _skip(buf, pos)
+    return pos
+
+def _record_values(record, names):
+    """Field values of a file or version record in wire form"""
+    values = [getattr(record, name) for name in names]
+    values[names.index('status')] = _STATUS_CODES.index(record.status)
+    if record.signature is not None:
+        values[names.index('signature')] = [
+            getattr(record.signature, name) for name in _SIGNATURE_FIELDS
+        ]
+    return values
+
+def _record_fields(values, names):
+    """Keyword arguments of a file or version record from its wire form"""
+    data = dict(zip(names, values))
+    data['status'] = _STATUS_CODES[data.get('status') or 0]
+    if data.get('signature') is not None:
+        data['signature'] = SignatureRecord(*data['signature'])
+    return data
+
+def encode_record(record):
+    """
+    Encode a FileRecord as MessagePack bytes
+
+    Args:
+        record: FileRecord to encode
+
+    Returns:
+        bytes: Encoded record
+    """
+    values = _record_values(record, _FILE_FIELDS)
+    if record.versions:
+        values[_FILE_FIELDS.index('versions')] = [
+            _record_values(version, _VERSION_FIELDS) for version in record.versions
+        ]
+    out = bytearray()
+    _pack(values, out)
+    return bytes(out)
+
+def decode_record(buf, pos=0):
+    """
+    Decode a FileRecord encoded with encode_record
+
+    Args:
+        buf: Buffer containing the encoded record
+        pos: Offset of the record in the buffer
+
+    Returns:
+        FileRecord: Decoded record
+    """
+    values, _ = _unpack(buf, pos)
+    data = _record_fields(values, _FILE_FIELDS)
+    if data.get('versions') is not None:
+        data['versions'] = [
+            VersionRecord(**_record_fields(version, _VERSION_FIELDS)) for version in data['versions']
+        ]
+    return FileRecord(**data)
+
+@functools.lru_cache(maxsize=32)
+def _field_indexes(names):
+    """Field name at each wire position up to the last wanted one, None elsewhere"""
+    indexes = [_FILE_FIELDS.index(name) for name in names]
+    wanted = [None] * (max(indexes) + 1)
+    for name, index in zip(names, indexes):
+        wanted[index] = name
+    return wanted
+
+def decode_fields(buf, pos, names):
+    """
+    Decode selected fields of an encoded FileRecord
+
+    Other fields are skipped without building values, which makes scans
+    of the whole store (e.g. for cleanup) much cheaper than decoding full
+    records.
+
+    Args:
+        buf: Buffer containing the encoded record
+        pos: Offset of the record in the buffer
+        names: FileRecord field names to decode
+
+    Returns:
+        dict: Field values; status and versions are decoded as in FileRecord,
+            fields missing from older records are None
+    """
+    tag = buf[pos]
+    if 0x90 <= tag <= 0x9f:
+        n, pos = tag & 0x0f, pos + 1
+    else:
+        fmt = _ARRAY_LENGTHS[tag]
+        n = struct.unpack_from(fmt, buf, pos + 1)[0]
+        pos += 1 + struct.calcsize(fmt)
+
+    wanted = _field_indexes(tuple(names))
+    values = dict.fromkeys(names)
+    # Stop after the last wanted field; inline the common one-byte skips
+    for index in range(min(n, len(wanted))):
+        name = wanted[index]
+        if name is not None:
+            values[name], pos = _unpack(buf, pos)
+            continue
+        tag = buf[pos]
+        if 0xa0 <= tag <= 0xbf:
+            pos += 1 + (tag & 0x1f)
+        elif tag < 0x80 or tag == 0xc0:
+            pos += 1
+        else:
+            pos = _skip(buf, pos)
+
+    if 'status' in values:
+        values['status'] = _STATUS_CODES[values['status'] or 0]
+    if values.get('signature') is not None:
+        values['signature'] = SignatureRecord(*values['signature'])
+    if values.get('versions') is not None:
+        values['versions'] = [
+            VersionRecord(**_record_fields(version, _VERSION_FIELDS)) for version in values['versions']
+        ]
+    return values
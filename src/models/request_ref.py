@@ -0,0 +1,12 @@
+from src.models.user import db
+
+class RequestReference(db.Model):
+    """Short-lived short ID standing in for a presentation request URI"""
+    __tablename__ = 'request_reference'
+
+    id = db.Column(db.String(16), primary_key=True)
+    file_id = db.Column(db.String(36), nullable=False)
+    expires_at = db.Column(db.Integer, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<RequestReference {self.id}>'
@@ -0,0 +1,13 @@
+from src.models.user import db
+
+class RevokedLink(db.Model):
+    """Revoked per-recipient share link, kept until the link would have expired"""
+    __tablename__ = 'revoked_link'
+
+    # Link IDs are only unique per file
+    file_id = db.Column(db.String(36), primary_key=True)
+    id = db.Column(db.String(32), primary_key=True)
+    expires_at = db.Column(db.Integer, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<RevokedLink {self.id}>'
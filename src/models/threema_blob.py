@@ -0,0 +1,13 @@
+from src.models.user import db
+
+class ThreemaBlob(db.Model):
+    """Encrypted file blob uploaded to Threema, reusable until it expires"""
+    __tablename__ = 'threema_blob'
+
+    sha256 = db.Column(db.String(64), primary_key=True)
+    blob_id = db.Column(db.String(32), nullable=False)
+    key = db.Column(db.String(64), nullable=False)
+    expires_at = db.Column(db.Integer, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<ThreemaBlob {self.blob_id}>'
@@ -1,8 +1,16 @@
+import os
 import qrcode
+import qrcode.constants
 import io
 import base64
+import logging
 from urllib.parse import quote
 
+logger = logging.getLogger(__name__)
+
+# Largest QR version payloads are expected to fit in; larger codes render and scan slower
+QR_MAX_VERSION = int(os.getenv('QR_MAX_VERSION', '4'))
+
 def generate_qr_code(auth_url, size=300):
     """
     Generate a QR code for SWIYU app authentication
@@ -22,10 +30,10 @@ def generate_qr_code(auth_url, size=300):
     else:
         swiyu_url = auth_url
     
-    # Create QR code instance
+    # Create QR code instance; the version is chosen to fit the payload
     qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECTION_L,
+        version=None,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
         box_size=10,
         border=4,
     )
@@ -34,6 +42,9 @@ def generate_qr_code(auth_url, size=300):
     qr.add_data(swiyu_url)
     qr.make(fit=True)
     
+    if qr.version > QR_MAX_VERSION:
+        logger.warning(f"QR payload of {len(swiyu_url)} chars needs version {qr.version}")
+    
     # Create an image from the QR code
     img = qr.make_image(fill_color="black", back_color="white")
     
@@ -46,13 +57,15 @@ def generate_qr_code(auth_url, size=300):
     
     return f"data:image/png;base64,{img_str}"
 
-def create_presentation_request(file_id, callback_url):
+def create_presentation_request(file_id, callback_url, request_ref=None):
     """
     Create a presentation request for the SWIYU App to use existing credentials
     
     Args:
         file_id: The ID of the file to be signed
         callback_url: The callback URL for the presentation response
+        request_ref: Optional short reference ID resolved by /r/<id>; keeps
+            the QR code at a low version
         
     Returns:
         Authentication URL for QR code
@@ -69,6 +82,9 @@ def create_presentation_request(file_id, callback_url):
     # 3. Set up proper callback handling
     
     # For now, we'll create a mock URL that follows the SWIYU protocol format for presentations
-    auth_url = f"swiyu://present?request_uri={callback_url}/api/presentation-request/{file_id}"
+    if request_ref:
+        auth_url = f"swiyu://present?request_uri={callback_url}/r/{request_ref}"
+    else:
+        auth_url = f"swiyu://present?request_uri={callback_url}/api/presentation-request/{file_id}"
     
     return auth_url
@@ -0,0 +1,74 @@
+import os
+import time
+import secrets
+import logging
+from sqlalchemy.exc import IntegrityError
+from src.models.user import db
+from src.models.request_ref import RequestReference
+
+logger = logging.getLogger(__name__)
+
+# Lifetime of a short request reference in seconds
+REQUEST_REF_TTL = int(os.getenv('REQUEST_REF_TTL', '600'))
+
+# 8 base62 characters give about 2 * 10^14 IDs, plenty for short-lived references
+REQUEST_REF_LENGTH = 8
+BASE62_ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+
+def new_ref_id(length=REQUEST_REF_LENGTH):
+    """Generate a random base62 ID"""
+    return ''.join(secrets.choice(BASE62_ALPHABET) for _ in range(length))
+
+def create_request_reference(file_id, ttl=None):
+    """
+    Create a short reference to the presentation request of a file
+    
+    Args:
+        file_id: The ID of the file the request is for
+        ttl: Lifetime in seconds, defaults to REQUEST_REF_TTL
+        
+    Returns:
+        str: The short reference ID
+    """
+    expires_at = int(time.time()) + (ttl or REQUEST_REF_TTL)
+    purge_expired_references()
+    
+    for _ in range(5):
+        ref_id = new_ref_id()
+        db.session.add(RequestReference(id=ref_id, file_id=file_id, expires_at=expires_at))
+        try:
+            db.session.commit()
+            return ref_id
+        except IntegrityError:
+            # Collisions are astronomically rare; just draw another ID
+            db.session.rollback()
+    
+    raise RuntimeError('Could not allocate a request reference')
+
+def resolve_request_reference(ref_id):
+    """
+    Look up the file a short reference points to
+    
+    Args:
+        ref_id: The short reference ID
+        
+    Returns:
+        str: The file ID, or None if the reference is unknown or expired
+    """
+    if len(ref_id) != REQUEST_REF_LENGTH:
+        return None
+    ref = db.session.get(RequestReference, ref_id)
+    if ref is None or ref.expires_at < time.time():
+        return None
+    return ref.file_id
+
+def purge_expired_references():
+    """Delete expired references using the expires_at index"""
+    try:
+        RequestReference.query.filter(
+            RequestReference.expires_at < int(time.time())
+        ).delete(synchronize_session=False)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error purging request references: {e}")
@@ -159,15 +159,20 @@ class SwiyuSignatureService:
         # 3. Create a signature object with metadata
         
         # For this proof of concept, we'll create a mock signature
-        with open(file_path, 'rb') as f:
-            file_hash = hashes.Hash(hashes.SHA256())
-            # Read in chunks to handle large files
-            chunk = f.read(8192)
-            while chunk:
-                file_hash.update(chunk)
-                chunk = f.read(8192)
-            digest = file_hash.finalize()
+        digest = self.compute_file_digest(file_path)
+        return self.sign_digest(digest, holder_did)
+    
+    def sign_digest(self, digest, holder_did):
+        """
+        Create signature data for a precomputed file digest
         
+        Args:
+            digest: Raw SHA-256 digest of the original file bytes
+            holder_did: DID of the holder who authenticated
+            
+        Returns:
+            Signature data
+        """
         # Create a signature timestamp
         timestamp = int(time.time())
         
@@ -199,15 +204,51 @@ class SwiyuSignatureService:
         # 3. Check the signature metadata
         
         # For this proof of concept, we'll just check if the file hash matches
+        digest = self.compute_file_digest(file_path)
+        return self.verify_digest(digest, signature_data)
+    
+    def compute_file_digest(self, file_path):
+        """
+        Compute the SHA-256 digest of a file
+        
+        Args:
+            file_path: Path to the file to hash
+            
+        Returns:
+            Raw digest bytes
+        """
         with open(file_path, 'rb') as f:
-            file_hash = hashes.Hash(hashes.SHA256())
-            # Read in chunks to handle large files
-            chunk = f.read(8192)
-            while chunk:
-                file_hash.update(chunk)
-                chunk = f.read(8192)
-            digest = file_hash.finalize()
+            return self.compute_stream_digest(f)
+    
+    def compute_stream_digest(self, stream):
+        """
+        Compute the SHA-256 digest of a readable binary stream
         
+        Args:
+            stream: Stream yielding the original file bytes
+            
+        Returns:
+            Raw digest bytes
+        """
+        file_hash = hashes.Hash(hashes.SHA256())
+        # Read in chunks to handle large files
+        chunk = stream.read(8192)
+        while chunk:
+            file_hash.update(chunk)
+            chunk = stream.read(8192)
+        return file_hash.finalize()
+    
+    def verify_digest(self, digest, signature_data):
+        """
+        Check a precomputed file digest against signature data
+        
+        Args:
+            digest: Raw digest bytes from compute_file_digest
+            signature_data: Signature data from sign_file
+            
+        Returns:
+            Boolean indicating if the signature is valid
+        """
         # Compare the hash
         expected_hash = base64.b64decode(signature_data["file_hash"])
         return digest == expected_hash
@@ -0,0 +1,256 @@
+import os
+import io
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from src import storage
+
+logger = logging.getLogger(__name__)
+
+# Directory of rendered previews, named by the content digest of the original
+PREVIEW_CACHE_DIR = os.getenv(
+    'PREVIEW_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'previews')
+)
+
+# Worker processes rendering previews
+PREVIEW_WORKERS = int(os.getenv('PREVIEW_WORKERS', '2'))
+
+# Renders queued or running at once; further requests are turned away
+PREVIEW_MAX_PENDING = int(os.getenv('PREVIEW_MAX_PENDING', '8'))
+
+# Address space limit per worker, which also applies to the PDF rasterizer it runs
+PREVIEW_WORKER_MEMORY_MB = int(os.getenv('PREVIEW_WORKER_MEMORY_MB', '768'))
+
+# Seconds a request waits for a render before asking the client to retry
+PREVIEW_TIMEOUT = int(os.getenv('PREVIEW_TIMEOUT', '15'))
+
+# Longest side of a preview in pixels
+PREVIEW_SIZE = int(os.getenv('PREVIEW_SIZE', '480'))
+
+# Source images above this many pixels are refused as likely decompression bombs
+PREVIEW_MAX_PIXELS = int(os.getenv('PREVIEW_MAX_PIXELS', str(64 * 1024 * 1024)))
+
+PREVIEW_MIMETYPE = 'image/jpeg'
+
+def is_previewable(content_type):
+    """Whether previews can be rendered for a content type"""
+    return content_type == 'application/pdf' or (
+        content_type.startswith('image/') and content_type != 'image/svg+xml'
+    )
+
+def _init_worker(memory_mb):
+    """Limit the memory of a worker process and its children"""
+    import resource
+    limit = memory_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+def _render(file_data, content_type, out_path):
+    """
+    Render the first page or frame of a file as a JPEG thumbnail
+
+    Runs in a worker process. The preview is written to a temporary file
+    and renamed into place so readers never see a partial image.
+
+    Args:
+        file_data: FileRecord of the file
+        content_type: Content type of the file
+        out_path: Path of the cached preview
+    """
+    from PIL import Image, ImageOps
+
+    Image.MAX_IMAGE_PIXELS = PREVIEW_MAX_PIXELS
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(out_path)) as tmp:
+        if content_type == 'application/pdf':
+            from pdf2image import convert_from_path
+
+            # pdftoppm needs a path; decode stored copies and chunks to a temporary file
+            if storage.stored_raw(file_data):
+                source = file_data.path
+            else:
+                source = os.path.join(tmp, 'source.pdf')
+                with storage.open_original(file_data) as stream, open(source, 'wb') as f:
+                    shutil.copyfileobj(stream, f, storage.CHUNK_SIZE)
+            image = convert_from_path(
+                source, first_page=1, last_page=1,
+                size=PREVIEW_SIZE, output_folder=tmp
+            )[0]
+        else:
+            with storage.open_original(file_data) as stream:
+                # Pillow needs a seekable file; decoded streams are buffered
+                image = Image.open(stream if storage.stored_raw(file_data) else io.BytesIO(stream.read()))
+                # Let JPEG decode at reduced scale instead of full size
+                image.draft('RGB', (PREVIEW_SIZE, PREVIEW_SIZE))
+                image = ImageOps.exif_transpose(image)
+                image.thumbnail((PREVIEW_SIZE, PREVIEW_SIZE))
+
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        tmp_path = os.path.join(tmp, 'preview.jpg')
+        image.save(tmp_path, 'JPEG', quality=80, optimize=True)
+        os.replace(tmp_path, out_path)
+
+class PreviewUnavailable(Exception):
+    """No preview can be rendered for a file"""
+
+class PreviewBusy(Exception):
+    """The render pool is at capacity or the render is still running"""
+
+class PreviewService:
+    """
+    Lazily render and cache first-page previews of PDFs and images
+
+    Previews are cached on disk by the SHA-256 of the original file, so
+    repeated views and identical uploads cost a stat. Cache misses render
+    on a process pool whose workers are memory-limited and recycled, and
+    the number of pending renders is bounded. Concurrent requests for the
+    same document share one render.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or PREVIEW_CACHE_DIR
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._slots = threading.BoundedSemaphore(PREVIEW_MAX_PENDING)
+
+    def _pool(self):
+        if self._executor is None:
+            # Workers are spawned rather than forked from the threaded app
+            # process, and recycled to return memory held by image decoders
+            self._executor = ProcessPoolExecutor(
+                max_workers=PREVIEW_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(PREVIEW_WORKER_MEMORY_MB,),
+                max_tasks_per_child=50
+            )
+        return self._executor
+
+    def _digest(self, file_data):
+        """Content digest of the original file; legacy records are hashed once and keep it"""
+        if not file_data.sha256:
+            sha256 = hashlib.sha256()
+            with storage.open_original(file_data) as stream:
+                for chunk in iter(lambda: stream.read(storage.CHUNK_SIZE), b''):
+                    sha256.update(chunk)
+            file_data.sha256 = sha256.hexdigest()
+        return file_data.sha256
+
+    def cache_path(self, digest):
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.jpg")
+
+    def get(self, file_data):
+        """
+        Return the cached preview of a file, rendering it if needed
+
+        Records without a digest get one set, which the caller should save.
+
+        Args:
+            file_data: FileRecord of the file
+
+        Returns:
+            tuple: (path, digest) of the preview image
+
+        Raises:
+            PreviewUnavailable: If the file type is unsupported or rendering failed
+            PreviewBusy: If the render could not finish within PREVIEW_TIMEOUT
+        """
+        content_type = file_data.content_type or storage.guess_content_type(file_data.filename)
+        if not is_previewable(content_type):
+            raise PreviewUnavailable(f"No preview for {content_type}")
+
+        digest = self._digest(file_data)
+        path = self.cache_path(digest)
+        if os.path.exists(path):
+            return path, digest
+
+        future = self._submit(digest, file_data, content_type, path)
+        try:
+            future.result(timeout=PREVIEW_TIMEOUT)
+        except TimeoutError:
+            raise PreviewBusy('Preview is still being rendered')
+        except BrokenProcessPool:
+            logger.error('Preview worker died, restarting the pool')
+            with self._lock:
+                self._executor = None
+            raise PreviewUnavailable('Preview rendering failed')
+        except Exception as e:
+            logger.warning(f"Could not render preview for {file_data.filename}: {e}")
+            raise PreviewUnavailable('Preview rendering failed')
+        return path, digest
+
+    def _submit(self, digest, file_data, content_type, path):
+        """Start a render, or join the one already running for this digest"""
+        with self._lock:
+            future = self._pending.get(digest)
+            if future is not None:
+                return future
+
+            if not self._slots.acquire(blocking=False):
+                raise PreviewBusy('Too many previews are being rendered')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                future = self._pool().submit(_render, file_data, content_type, path)
+            except Exception:
+                self._slots.release()
+                raise
+            self._pending[digest] = future
+
+        def done(_):
+            with self._lock:
+                self._pending.pop(digest, None)
+            self._slots.release()
+
+        future.add_done_callback(done)
+        return future
+
+    def collect_garbage(self, live_digests, grace=3600):
+        """
+        Delete cached previews no longer referenced by any file version
+
+        Args:
+            live_digests: Content digests still in use
+            grace: Files younger than this many seconds are kept, so renders
+                in progress are left alone
+
+        Returns:
+            int: Number of files removed
+        """
+        live_digests = set(live_digests)
+        removed = 0
+        cutoff = time.time() - grace
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if name.split('.', 1)[0] in live_digests:
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    pass
+        if removed:
+            logger.info(f"Removed {removed} unreferenced previews")
+        return removed
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
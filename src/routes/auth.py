@@ -0,0 +1,23 @@
+import os
+import hmac
+from flask import jsonify, request
+
+# Bearer token for the user and file listings and for managing users; the
+# listings show every user's email and every file ID, so none of these
+# routes are served without one
+LISTING_API_TOKEN = os.getenv('LISTING_API_TOKEN')
+
+def require_api_token():
+    """
+    Reject requests without the API token
+
+    Used as a blueprint before_request hook.
+
+    Returns:
+        A 401 response, or None to continue with the view
+    """
+    header = request.headers.get('Authorization', '')
+    token = header[len('Bearer '):] if header.startswith('Bearer ') else ''
+    if not LISTING_API_TOKEN or not hmac.compare_digest(token.encode('utf-8'), LISTING_API_TOKEN.encode('utf-8')):
+        return jsonify({'error': 'Authentication required'}), 401
+    return None
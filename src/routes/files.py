@@ -0,0 +1,57 @@
+from flask import Blueprint, jsonify, request
+from sqlalchemy import and_, or_
+from src.models.user import User
+from src.models.file_index import FileEntry
+from src.routes.pagination import page_size, decode_cursor, stream_page
+from src.routes.auth import require_api_token
+
+files_bp = Blueprint('files', __name__)
+files_bp.before_request(require_api_token)
+
+# Filters accepted by the file listings, mapped to their indexed columns
+FILE_FILTERS = {
+    'owner_id': FileEntry.owner_id,
+    'signer': FileEntry.signer,
+    'status': FileEntry.status
+}
+
+def _list_files(filters):
+    """Stream a keyset page of files, newest first"""
+    try:
+        cursor = decode_cursor(request.args.get('cursor'), ((int, float), str))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    query = FileEntry.query
+    for name, value in filters.items():
+        query = query.filter(FILE_FILTERS[name] == value)
+
+    # Continue strictly after the last (timestamp, id) of the previous page
+    if cursor:
+        timestamp, file_id = cursor
+        query = query.filter(or_(
+            FileEntry.timestamp < timestamp,
+            and_(FileEntry.timestamp == timestamp, FileEntry.id < file_id)
+        ))
+    query = query.order_by(FileEntry.timestamp.desc(), FileEntry.id.desc())
+
+    return stream_page(query, page_size(), FileEntry.to_dict,
+                       lambda entry: [entry.timestamp, entry.id])
+
+@files_bp.route('/files', methods=['GET'])
+def get_files():
+    filters = {}
+    for name in FILE_FILTERS:
+        value = request.args.get(name, type=int if name == 'owner_id' else str)
+        if value is not None:
+            filters[name] = value
+    return _list_files(filters)
+
+@files_bp.route('/users/<int:user_id>/files', methods=['GET'])
+def get_user_files(user_id):
+    User.query.get_or_404(user_id)
+    filters = {'owner_id': user_id}
+    status = request.args.get('status')
+    if status:
+        filters['status'] = status
+    return _list_files(filters)
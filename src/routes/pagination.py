@@ -0,0 +1,82 @@
+import json
+import base64
+from flask import Response, request, stream_with_context
+
+# Page size limits for listing endpoints
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Rows fetched from the database per round trip while streaming a page
+STREAM_BATCH_SIZE = 200
+
+def page_size():
+    """Read the requested page size from the query string"""
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def encode_cursor(*values):
+    """Encode the sort key of the last row of a page as an opaque cursor"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor, types):
+    """
+    Decode a cursor produced by encode_cursor
+
+    Args:
+        cursor: Cursor from the query string, or None
+        types: Expected type (or tuple of types) of each sort key value
+
+    Returns:
+        list: The sort key values, or None if no cursor was given
+
+    Raises:
+        ValueError: If the cursor is malformed or does not match types
+    """
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    # Cursors come from clients, so check their shape before building queries
+    if not isinstance(values, list) or len(values) != len(types) or not all(
+        isinstance(value, expected) and not isinstance(value, bool)
+        for value, expected in zip(values, types)
+    ):
+        raise ValueError('Invalid cursor')
+    return values
+
+def stream_page(query, limit, serialize, cursor_key):
+    """
+    Stream one keyset page as a JSON object
+
+    The query must already be filtered past the previous cursor and ordered
+    by the sort key. One extra row is fetched to decide whether there is a
+    next page; rows are serialized as they arrive instead of being buffered.
+
+    Args:
+        query: SQLAlchemy query for the page
+        limit: Page size
+        serialize: Callable turning a row into a JSON-serializable dict
+        cursor_key: Callable returning the sort key values of a row
+
+    Returns:
+        Response: Streaming application/json response with "items" and
+            "next_cursor"
+    """
+    def generate():
+        yield '{"items": ['
+        last = None
+        count = 0
+        has_more = False
+        for row in query.limit(limit + 1).yield_per(STREAM_BATCH_SIZE):
+            if count == limit:
+                has_more = True
+                break
+            yield (', ' if count else '') + json.dumps(serialize(row))
+            last = row
+            count += 1
+        next_cursor = encode_cursor(*cursor_key(last)) if has_more else None
+        yield '], "next_cursor": ' + json.dumps(next_cursor) + '}'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
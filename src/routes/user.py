@@ -1,17 +1,35 @@
 from flask import Blueprint, jsonify, request
 from src.models.user import User, db
+from src.routes.pagination import page_size, decode_cursor, stream_page
+from src.routes.auth import require_api_token
 
 user_bp = Blueprint('user', __name__)
+user_bp.before_request(require_api_token)
 
 @user_bp.route('/users', methods=['GET'])
 def get_users():
-    users = User.query.all()
-    return jsonify([user.to_dict() for user in users])
+    try:
+        cursor = decode_cursor(request.args.get('cursor'), (int,))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    query = User.query
+    # Optional username prefix filter, served by the unique index on username
+    prefix = request.args.get('username')
+    if prefix:
+        query = query.filter(User.username.startswith(prefix, autoescape=True))
+    if cursor:
+        query = query.filter(User.id > cursor[0])
+    query = query.order_by(User.id)
+    
+    return stream_page(query, page_size(), User.to_dict, lambda user: [user.id])
 
 @user_bp.route('/users', methods=['POST'])
 def create_user():
     
-    data = request.json
+    data = request.get_json(silent=True) or {}
+    if not data.get('username') or not data.get('email'):
+        return jsonify({'error': 'username and email are required'}), 400
     user = User(username=data['username'], email=data['email'])
     db.session.add(user)
     db.session.commit()
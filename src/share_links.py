@@ -0,0 +1,192 @@
+import os
+import hmac
+import time
+import hashlib
+import secrets
+import logging
+import threading
+from itsdangerous import URLSafeSerializer, BadSignature
+from src.models.user import db
+from src.models.revoked_link import RevokedLink
+
+logger = logging.getLogger(__name__)
+
+# HMAC secret shared by all workers; generated and kept on the uploads disk if
+# not set, so links survive deploys
+SHARE_TOKEN_SECRET = os.getenv('SHARE_TOKEN_SECRET')
+SHARE_TOKEN_KEY_PATH = os.getenv(
+    'SHARE_TOKEN_KEY_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'uploads', 'share_token.key')
+)
+
+# Lifetime of share and verify links in seconds
+SHARE_LINK_TTL = int(os.getenv('SHARE_LINK_TTL', str(7 * 24 * 3600)))
+
+# Seconds between reloads of the revocation list from the database
+SHARE_REVOCATION_REFRESH = int(os.getenv('SHARE_REVOCATION_REFRESH', '10'))
+
+# Actions a link can permit
+SHARE = 'share'
+VERIFY = 'verify'
+ACTIONS = {SHARE: 's', VERIFY: 'v'}
+
+class InvalidLink(Exception):
+    """A share token is malformed, forged, expired, revoked or lacks the action"""
+
+    def __init__(self, message, status=403):
+        super().__init__(message)
+        self.status = status
+
+def _load_secret():
+    """Return the configured secret, or the one persisted on disk"""
+    if SHARE_TOKEN_SECRET:
+        return SHARE_TOKEN_SECRET
+    os.makedirs(os.path.dirname(SHARE_TOKEN_KEY_PATH), exist_ok=True)
+    try:
+        fd = os.open(SHARE_TOKEN_KEY_PATH, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(SHARE_TOKEN_KEY_PATH) as f:
+            return f.read().strip()
+    secret = secrets.token_urlsafe(32)
+    with os.fdopen(fd, 'w') as f:
+        f.write(secret)
+    return secret
+
+class ShareLinkService:
+    """
+    Issue and check signed, expiring share and verify links
+
+    A token carries the file ID, permitted actions and expiry, signed with
+    HMAC-SHA256, so forged or expired links are rejected before any file
+    lookup. Per-recipient tokens also carry a link ID that can be revoked.
+    Link IDs are bound to their file by an HMAC, so the holder of one
+    file's share link cannot revoke links of other files. Revocations are
+    kept in memory and refreshed from the database periodically, so
+    checking them is a set lookup.
+    """
+
+    def __init__(self, secret=None):
+        secret = secret or _load_secret()
+        self._serializer = URLSafeSerializer(secret, salt='share-link')
+        self._link_key = hashlib.sha256(f"share-link-id:{secret}".encode('utf-8')).digest()
+        self._revoked = set()
+        self._revoked_loaded = 0
+        self._lock = threading.Lock()
+
+    def issue(self, file_id, actions=(VERIFY,), recipient=None, ttl=None, version=None):
+        """
+        Issue a signed link token
+
+        Args:
+            file_id: The ID of the file the link is for
+            actions: Actions the link permits, see ACTIONS
+            recipient: Optional recipient (e.g. a Threema ID); such links get
+                a revocable link ID
+            ttl: Lifetime in seconds, defaults to SHARE_LINK_TTL
+            version: Optional version number the link is bound to; without
+                one it follows the current version
+
+        Returns:
+            tuple: (token, link_id), link_id is None without a recipient
+        """
+        payload = {
+            'f': file_id,
+            'a': ''.join(ACTIONS[action] for action in actions),
+            'e': int(time.time()) + (ttl or SHARE_LINK_TTL)
+        }
+        link_id = None
+        if recipient:
+            link_id = self._link_id(file_id, secrets.token_hex(8))
+            payload['r'] = recipient
+            payload['j'] = link_id
+        if version is not None:
+            payload['v'] = version
+        return self._serializer.dumps(payload), link_id
+
+    def check(self, token, action):
+        """
+        Check a link token for an action
+
+        Args:
+            token: The token from the URL
+            action: The action being performed
+
+        Returns:
+            dict: The file_id, version, expires_at, recipient and link_id of the token
+
+        Raises:
+            InvalidLink: If the token does not permit the action
+        """
+        try:
+            payload = self._serializer.loads(token)
+        except BadSignature:
+            raise InvalidLink('Invalid link')
+
+        if ACTIONS[action] not in payload.get('a', ''):
+            raise InvalidLink('Link does not permit this action')
+        if payload.get('e', 0) < time.time():
+            raise InvalidLink('Link has expired', 410)
+        if payload.get('j') and self.is_revoked(payload['f'], payload['j']):
+            raise InvalidLink('Link has been revoked', 410)
+
+        return {
+            'file_id': payload['f'],
+            'version': payload.get('v'),
+            'expires_at': payload['e'],
+            'recipient': payload.get('r'),
+            'link_id': payload.get('j')
+        }
+
+    def _link_id(self, file_id, nonce):
+        """Link ID made of a nonce and its HMAC together with the file ID"""
+        mac = hmac.new(self._link_key, f"{file_id}:{nonce}".encode('utf-8'), hashlib.sha256)
+        return nonce + mac.hexdigest()[:16]
+
+    def link_belongs_to(self, file_id, link_id):
+        """Whether a link ID was issued for a file"""
+        if not isinstance(link_id, str) or len(link_id) != 32:
+            return False
+        return hmac.compare_digest(self._link_id(file_id, link_id[:16]), link_id)
+
+    def revoke(self, file_id, link_id):
+        """
+        Revoke a per-recipient link
+
+        Args:
+            file_id: The file the link is for
+            link_id: The link ID returned by issue
+
+        Raises:
+            InvalidLink: If the link ID was not issued for the file
+        """
+        if not self.link_belongs_to(file_id, link_id):
+            raise InvalidLink('Link does not belong to this file')
+        # Links never outlive SHARE_LINK_TTL, so neither must the revocation
+        db.session.merge(RevokedLink(
+            id=link_id, file_id=file_id, expires_at=int(time.time()) + SHARE_LINK_TTL
+        ))
+        db.session.commit()
+        with self._lock:
+            self._revoked.add((file_id, link_id))
+
+    def is_revoked(self, file_id, link_id):
+        """Check a file's link ID against the cached revocation list"""
+        if time.time() - self._revoked_loaded >= SHARE_REVOCATION_REFRESH:
+            self._refresh_revoked()
+        return (file_id, link_id) in self._revoked
+
+    def _refresh_revoked(self):
+        """Reload unexpired revocations and purge expired ones"""
+        now = int(time.time())
+        self._revoked_loaded = now
+        try:
+            RevokedLink.query.filter(RevokedLink.expires_at < now).delete(synchronize_session=False)
+            db.session.commit()
+            revoked = {(row.file_id, row.id) for row in db.session.query(RevokedLink.file_id, RevokedLink.id)}
+        except Exception as e:
+            db.session.rollback()
+            # Keep the previous list rather than letting revoked links through
+            logger.error(f"Error loading revoked links: {e}")
+            return
+        with self._lock:
+            self._revoked = revoked
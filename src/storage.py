@@ -0,0 +1,315 @@
+import os
+import io
+import zlib
+import hashlib
+import logging
+import mimetypes
+import brotli
+from src import chunk_store
+
+logger = logging.getLogger(__name__)
+
+# Compression applied to compressible uploads: 'br', 'gzip' or 'none'
+STORAGE_COMPRESSION = os.getenv('STORAGE_COMPRESSION', 'br')
+
+# Chunk size for streaming reads and writes
+CHUNK_SIZE = 64 * 1024
+
+# File extensions appended to the stored file for each encoding
+ENCODING_SUFFIXES = {
+    'br': '.br',
+    'gzip': '.gz'
+}
+
+# Content types that are worth compressing; media and archives are already compressed
+COMPRESSIBLE_PREFIXES = ('text/',)
+COMPRESSIBLE_TYPES = {
+    'application/json',
+    'application/xml',
+    'application/javascript',
+    'application/rtf',
+    'application/x-tar',
+    'application/msword',
+    'application/vnd.ms-excel',
+    'application/postscript',
+    'image/svg+xml',
+    'image/bmp',
+    'image/tiff'
+}
+
+def guess_content_type(filename, declared=None):
+    """
+    Determine the content type of an upload
+
+    Args:
+        filename: Name of the uploaded file
+        declared: Content type sent by the client, if any
+
+    Returns:
+        str: Content type
+    """
+    if declared and declared != 'application/octet-stream':
+        return declared.split(';')[0].strip().lower()
+    guessed, _ = mimetypes.guess_type(filename)
+    return guessed or 'application/octet-stream'
+
+def is_compressible(content_type):
+    """Whether content of this type is worth compressing"""
+    return content_type.startswith(COMPRESSIBLE_PREFIXES) or content_type in COMPRESSIBLE_TYPES
+
+def choose_encoding(content_type):
+    """
+    Pick the storage encoding for a content type
+
+    Args:
+        content_type: Content type of the upload
+
+    Returns:
+        str: 'br' or 'gzip', or None to store the file raw
+    """
+    if STORAGE_COMPRESSION not in ENCODING_SUFFIXES:
+        return None
+    if is_compressible(content_type):
+        return STORAGE_COMPRESSION
+    return None
+
+class StorageWriter:
+    """
+    Writes an upload to disk in a single streaming pass
+
+    The original bytes are hashed and counted as they pass through, so the
+    digest and size always describe the original content even when the
+    stored bytes are compressed.
+    """
+
+    def __init__(self, path, encoding=None):
+        """
+        Open a stored file for writing
+
+        Args:
+            path: Destination path without the encoding suffix
+            encoding: 'br', 'gzip' or None for raw storage
+        """
+        self.encoding = encoding
+        self.path = path + ENCODING_SUFFIXES.get(encoding, '')
+        self.size = 0
+        self.stored_size = 0
+        self._hash = hashlib.sha256()
+
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=5)
+        elif encoding == 'gzip':
+            # zopfli cannot compress incrementally, so streaming uses zlib
+            self._compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+        else:
+            self._compressor = None
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = open(self.path, 'wb')
+
+    def _emit(self, data):
+        if data:
+            self._file.write(data)
+            self.stored_size += len(data)
+
+    def write(self, chunk):
+        """Write a chunk of original bytes"""
+        self._hash.update(chunk)
+        self.size += len(chunk)
+
+        if self._compressor is None:
+            self._emit(chunk)
+        elif self.encoding == 'br':
+            self._emit(self._compressor.process(chunk))
+        else:
+            self._emit(self._compressor.compress(chunk))
+
+    def close(self):
+        """
+        Finish the stored file
+
+        Returns:
+            dict: Storage metadata to merge into the file record
+        """
+        if self.encoding == 'br':
+            self._emit(self._compressor.finish())
+        elif self.encoding == 'gzip':
+            self._emit(self._compressor.flush())
+        self._file.close()
+
+        return {
+            'path': self.path,
+            'size': self.size,
+            'stored_size': self.stored_size,
+            'encoding': self.encoding,
+            'sha256': self._hash.hexdigest()
+        }
+
+    def abort(self):
+        """Discard a partially written file"""
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+def save_upload(stream, path, content_type):
+    """
+    Store an uploaded stream, compressing it if the content type allows
+
+    Args:
+        stream: Readable binary stream of the upload
+        path: Destination path without the encoding suffix
+        content_type: Content type of the upload
+
+    Returns:
+        dict: Storage metadata to merge into the file record
+    """
+    writer = StorageWriter(path, choose_encoding(content_type))
+    try:
+        chunk = stream.read(CHUNK_SIZE)
+        while chunk:
+            writer.write(chunk)
+            chunk = stream.read(CHUNK_SIZE)
+    except Exception:
+        writer.abort()
+        raise
+
+    meta = writer.close()
+    meta['content_type'] = content_type
+    if meta['encoding']:
+        logger.info(f"Stored {meta['size']} bytes as {meta['stored_size']} ({meta['encoding']})")
+    return meta
+
+class _DecodingReader(io.RawIOBase):
+    """
+    Read-only stream that decompresses a stored file on the fly
+
+    Each step produces at most CHUNK_SIZE bytes of output, so memory stays
+    bounded and reads stay linear even for highly compressible files.
+    """
+
+    def __init__(self, path, encoding):
+        self._file = open(path, 'rb')
+        if encoding == 'br':
+            self._decompressor = brotli.Decompressor()
+            self._next_output = self._next_brotli
+            self._finished = self._decompressor.is_finished
+        else:
+            self._decompressor = zlib.decompressobj(31)
+            self._next_output = self._next_gzip
+            self._finished = lambda: self._decompressor.eof
+        self._path = path
+        self._pending = b''
+        self._buffer = memoryview(b'')
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    def _end_of_file(self):
+        # A truncated file would otherwise read as short content
+        if not self._finished():
+            raise IOError(f"Stored file {self._path} is truncated")
+        self._eof = True
+        return b''
+
+    def _next_brotli(self):
+        # Pending output must be drained with empty input before feeding more
+        data = b''
+        if self._decompressor.can_accept_more_data():
+            data = self._file.read(CHUNK_SIZE)
+        output = self._decompressor.process(data, output_buffer_limit=CHUNK_SIZE)
+        if not data and not output:
+            return self._end_of_file()
+        return output
+
+    def _next_gzip(self):
+        if not self._pending:
+            self._pending = self._file.read(CHUNK_SIZE)
+            if not self._pending:
+                # Flush output inflate still holds for input it has consumed
+                return self._decompressor.decompress(b'', CHUNK_SIZE) or self._end_of_file()
+        output = self._decompressor.decompress(self._pending, CHUNK_SIZE)
+        self._pending = self._decompressor.unconsumed_tail
+        return output
+
+    def readinto(self, b):
+        while not self._buffer and not self._eof:
+            self._buffer = memoryview(self._next_output())
+
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+def stored_raw(file_data):
+    """Whether the original bytes are stored unchanged at file_data.path"""
+    return not file_data.manifest and not file_data.encoding
+
+def open_original(file_data):
+    """
+    Open a stored file for reading its original bytes
+
+    Args:
+        file_data: FileRecord or VersionRecord of the stored file
+
+    Returns:
+        Readable binary stream yielding the original content
+    """
+    if file_data.manifest:
+        return chunk_store.open_manifest(file_data.manifest, CHUNK_SIZE)
+    encoding = file_data.encoding
+    if not encoding:
+        return open(file_data.path, 'rb')
+    return io.BufferedReader(_DecodingReader(file_data.path, encoding), CHUNK_SIZE)
+
+def save_version(stream, content_type):
+    """
+    Store an uploaded version as content-defined chunks
+
+    Only chunks not already stored, e.g. by earlier versions, are written.
+
+    Args:
+        stream: Readable binary stream of the upload
+        content_type: Content type of the upload
+
+    Returns:
+        dict: Storage metadata to merge into the file record, plus the
+            chunk counts
+    """
+    meta = chunk_store.store_stream(stream, compress=choose_encoding(content_type) is not None)
+    meta.update(path='', encoding=None, content_type=content_type)
+    logger.info(f"Stored {meta['size']} bytes in {meta['chunks']} chunks, "
+                f"{meta['new_chunks']} new ({meta['stored_size']} bytes written)")
+    return meta
+
+def accepts_encoding(accept_encoding, encoding):
+    """
+    Check whether an Accept-Encoding header allows an encoding
+
+    Args:
+        accept_encoding: Value of the Accept-Encoding request header
+        encoding: Content coding to check, e.g. 'br'
+
+    Returns:
+        bool: True if the client accepts the encoding
+    """
+    qualities = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip().replace(' ', '')
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[name.strip().lower()] = quality
+
+    quality = qualities.get(encoding, qualities.get('*', 0.0))
+    return quality > 0
@@ -0,0 +1,300 @@
+import os
+import json
+import time
+import ctypes
+import secrets
+import logging
+import tempfile
+import threading
+import binascii
+import libnacl
+import libnacl.public
+import libnacl.utils
+import requests
+from threema.gateway.key import Key
+from src import storage, tracing
+from src.models.user import db
+from src.models.threema_blob import ThreemaBlob
+
+logger = logging.getLogger(__name__)
+
+# Base URL of the Threema Gateway API; point it at a fake server for testing
+THREEMA_API_URL = os.getenv('THREEMA_API_URL', 'https://msgapi.threema.ch').rstrip('/')
+
+# Seconds an uploaded blob is reused for further recipients
+THREEMA_BLOB_TTL = int(os.getenv('THREEMA_BLOB_TTL', str(24 * 3600)))
+
+# Largest file the blob server accepts
+THREEMA_MAX_BLOB_SIZE = int(os.getenv('THREEMA_MAX_BLOB_SIZE', str(50 * 1024 * 1024)))
+
+# Timeout in seconds for Gateway requests; uploads get this per read of the body
+THREEMA_TIMEOUT = int(os.getenv('THREEMA_TIMEOUT', '30'))
+
+# Nonce Threema uses for file blobs; safe because every blob has a fresh key
+FILE_NONCE = b'\x00' * 23 + b'\x01'
+
+FILE_MESSAGE_TYPE = 0x17
+
+_sodium = libnacl.nacl
+_sodium.crypto_stream_xsalsa20_xor_ic.argtypes = [
+    ctypes.c_char_p, ctypes.c_char_p, ctypes.c_ulonglong,
+    ctypes.c_char_p, ctypes.c_uint64, ctypes.c_char_p
+]
+_sodium.crypto_onetimeauth_poly1305_init.argtypes = [ctypes.c_void_p, ctypes.c_char_p]
+_sodium.crypto_onetimeauth_poly1305_update.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_ulonglong]
+_sodium.crypto_onetimeauth_poly1305_final.argtypes = [ctypes.c_void_p, ctypes.c_char_p]
+
+# XSalsa20 block size; the stream cipher is addressed in whole blocks
+_BLOCK = 64
+_TAG_SIZE = 16
+
+class _Poly1305:
+    """Incremental Poly1305 over libsodium's state API"""
+
+    def __init__(self, key):
+        # The state must be 16-byte aligned, which ctypes buffers do not promise
+        size = _sodium.crypto_onetimeauth_poly1305_statebytes()
+        self._buffer = ctypes.create_string_buffer(size + 16)
+        address = ctypes.addressof(self._buffer)
+        self._state = ctypes.c_void_p(address + (-address % 16))
+        _sodium.crypto_onetimeauth_poly1305_init(self._state, key)
+
+    def update(self, data):
+        _sodium.crypto_onetimeauth_poly1305_update(self._state, data, len(data))
+
+    def final(self):
+        tag = ctypes.create_string_buffer(_TAG_SIZE)
+        _sodium.crypto_onetimeauth_poly1305_final(self._state, tag)
+        return tag.raw
+
+def _xsalsa20_xor(data, nonce, key, offset):
+    """XOR data with the XSalsa20 keystream starting at a byte offset"""
+    # Start at the enclosing block boundary and drop the leading bytes
+    skip = offset % _BLOCK
+    if skip:
+        data = b'\x00' * skip + data
+    out = ctypes.create_string_buffer(len(data))
+    if _sodium.crypto_stream_xsalsa20_xor_ic(out, data, len(data), nonce, offset // _BLOCK, key):
+        raise ValueError('Stream encryption failed')
+    return out.raw[skip:]
+
+def encrypt_stream(stream, out, key, nonce):
+    """
+    Encrypt a stream into a NaCl secretbox without holding it in memory
+
+    Produces the same bytes as crypto_secretbox (tag followed by
+    ciphertext). The ciphertext is written first and the tag is filled in
+    at the start of the output afterwards.
+
+    Args:
+        stream: Readable binary stream of the plaintext
+        out: Seekable binary file for the result
+        key: 32-byte secret key
+        nonce: 24-byte nonce
+
+    Returns:
+        int: Number of bytes written
+    """
+    # The first 32 keystream bytes are the one-time Poly1305 key
+    mac = _Poly1305(_xsalsa20_xor(b'\x00' * 32, nonce, key, 0))
+    start = out.tell()
+    out.write(b'\x00' * _TAG_SIZE)
+
+    offset = 32
+    for chunk in iter(lambda: stream.read(storage.CHUNK_SIZE), b''):
+        ciphertext = _xsalsa20_xor(chunk, nonce, key, offset)
+        mac.update(ciphertext)
+        out.write(ciphertext)
+        offset += len(chunk)
+
+    end = out.tell()
+    out.seek(start)
+    out.write(mac.final())
+    out.seek(end)
+    return end - start
+
+class _MultipartFile:
+    """
+    Read-only multipart/form-data body with one file field
+
+    requests sends objects with read() and a length in blocks, so the file
+    is streamed from disk instead of being loaded into memory.
+    """
+
+    def __init__(self, field, fileobj, size):
+        self.boundary = secrets.token_hex(16)
+        self._parts = [
+            (f"--{self.boundary}\r\n"
+             f"Content-Disposition: form-data; name=\"{field}\"; filename=\"{field}\"\r\n"
+             f"Content-Type: application/octet-stream\r\n\r\n").encode('ascii'),
+            fileobj,
+            f"\r\n--{self.boundary}--\r\n".encode('ascii')
+        ]
+        self._length = len(self._parts[0]) + size + len(self._parts[2])
+        self._index = 0
+        self._pos = 0
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._length
+        result = bytearray()
+        while len(result) < size and self._index < len(self._parts):
+            part = self._parts[self._index]
+            if isinstance(part, bytes):
+                data = part[self._pos:self._pos + size - len(result)]
+                self._pos += len(data)
+            else:
+                data = part.read(size - len(result))
+            if data:
+                result += data
+            else:
+                self._index += 1
+                self._pos = 0
+        return bytes(result)
+
+class ThreemaFileSender:
+    """
+    Send files as end-to-end encrypted Threema file messages
+
+    The file is encrypted in one streaming pass into a temporary file,
+    uploaded to the blob server as a streamed multipart body and referenced
+    from an E2E file message. Blob IDs and keys are cached by the file's
+    content digest, so sending to further recipients only sends a message.
+    """
+
+    def __init__(self, identity, secret, private_key, api_url=None):
+        """
+        Args:
+            identity: Gateway ID
+            secret: Gateway API secret
+            private_key: Gateway private key, encoded as "private:<hex>"
+            api_url: Base URL of the Gateway API
+        """
+        self.identity = identity
+        self.secret = secret
+        self.private_key = Key.decode(private_key, Key.Type.private)
+        self.api_url = (api_url or THREEMA_API_URL).rstrip('/')
+        self._public_keys = {}
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+
+    def _auth(self):
+        return {'from': self.identity, 'secret': self.secret}
+
+    def public_key(self, recipient):
+        """Fetch and cache the public key of a Threema ID"""
+        key = self._public_keys.get(recipient)
+        if key is None:
+            with tracing.span('threema.public_key'):
+                response = self._session.get(
+                    f"{self.api_url}/pubkeys/{recipient}", params=self._auth(), timeout=THREEMA_TIMEOUT
+                )
+                response.raise_for_status()
+            key = libnacl.public.PublicKey(binascii.unhexlify(response.text.strip()))
+            with self._lock:
+                self._public_keys[recipient] = key
+        return key
+
+    def upload_file(self, file_data):
+        """
+        Encrypt and upload a file, reusing a cached blob of the same content
+
+        Args:
+            file_data: FileRecord of the file
+
+        Returns:
+            tuple: (blob_id, key) where key is the 32-byte secret key
+        """
+        now = int(time.time())
+        cached = db.session.get(ThreemaBlob, file_data.sha256) if file_data.sha256 else None
+        if cached is not None and cached.expires_at > now:
+            tracing.current_span().set(blob_cached=True)
+            return cached.blob_id, binascii.unhexlify(cached.key)
+
+        if file_data.size > THREEMA_MAX_BLOB_SIZE:
+            raise ValueError(f"File exceeds the {THREEMA_MAX_BLOB_SIZE} byte blob limit")
+
+        key = libnacl.utils.salsa_key()
+        with tempfile.TemporaryFile() as encrypted:
+            with tracing.span('threema.encrypt', size=file_data.size), \
+                    storage.open_original(file_data) as stream:
+                size = encrypt_stream(stream, encrypted, key, FILE_NONCE)
+            encrypted.seek(0)
+
+            body = _MultipartFile('blob', encrypted, size)
+            with tracing.span('threema.upload_blob', size=size):
+                response = self._session.post(
+                    f"{self.api_url}/upload_blob", params=self._auth(), data=body,
+                    headers={'Content-Type': body.content_type}, timeout=THREEMA_TIMEOUT
+                )
+                response.raise_for_status()
+        blob_id = response.text.strip()
+        logger.info(f"Uploaded Threema blob {blob_id} ({size} bytes)")
+
+        if file_data.sha256:
+            try:
+                db.session.merge(ThreemaBlob(
+                    sha256=file_data.sha256, blob_id=blob_id,
+                    key=binascii.hexlify(key).decode('ascii'),
+                    expires_at=now + THREEMA_BLOB_TTL
+                ))
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Error caching Threema blob: {e}")
+        return blob_id, key
+
+    def send_file(self, recipient, file_data, caption=None):
+        """
+        Send a file to a Threema ID as an E2E file message
+
+        Args:
+            recipient: Threema ID of the recipient
+            file_data: FileRecord of the file
+            caption: Optional caption shown with the file
+
+        Returns:
+            str: The message ID
+        """
+        public_key = self.public_key(recipient)
+        blob_id, key = self.upload_file(file_data)
+
+        content = {
+            'b': blob_id,
+            'k': binascii.hexlify(key).decode('ascii'),
+            'm': file_data.content_type or storage.guess_content_type(file_data.filename),
+            'n': file_data.filename,
+            's': file_data.size,
+            'i': 0
+        }
+        if caption:
+            content['d'] = caption
+        payload = bytes([FILE_MESSAGE_TYPE]) + json.dumps(content, separators=(',', ':')).encode('utf-8')
+
+        # PKCS#7-style random padding hides the message length
+        padding = max(secrets.randbelow(255) + 1, 32 - (len(payload) - 1))
+        payload += bytes([padding]) * padding
+
+        box = libnacl.public.Box(self.private_key, public_key)
+        nonce, encrypted = box.encrypt(payload, pack_nonce=False)
+
+        with tracing.span('threema.send_e2e', size=len(encrypted)):
+            response = self._session.post(
+                f"{self.api_url}/send_e2e",
+                data={
+                    **self._auth(),
+                    'to': recipient,
+                    'nonce': binascii.hexlify(nonce).decode('ascii'),
+                    'box': binascii.hexlify(encrypted).decode('ascii')
+                },
+                timeout=THREEMA_TIMEOUT
+            )
+            response.raise_for_status()
+        return response.text.strip()
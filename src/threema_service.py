@@ -1,10 +1,10 @@
 import os
 import json
 import logging
+import requests
 from threema.gateway import Connection, GatewayError, MessageError
+from src.threema_files import ThreemaFileSender
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class ThreemaService:
@@ -23,6 +23,15 @@ class ThreemaService:
         except Exception as e:
             logger.error(f"Failed to initialize Threema connection: {e}")
             self.connection = None
+        
+        # End-to-end file messages need the Gateway ID's private key
+        self.file_sender = None
+        private_key = os.getenv('THREEMA_PRIVATE_KEY')
+        if private_key:
+            try:
+                self.file_sender = ThreemaFileSender(self.identity, self.secret, private_key)
+            except Exception as e:
+                logger.error(f"Failed to initialize Threema file sending: {e}")
     
     def send_message(self, recipient, message):
         """
@@ -48,7 +57,10 @@ class ThreemaService:
             # message_id = self.connection.send_text(recipient, message)
             
             # Simulate successful sending
-            logger.info(f"Simulated sending message to {recipient}: {message}")
+            logger.info(
+                f"Simulated sending message to {recipient}",
+                extra={'recipient': recipient, 'message_length': len(message)}
+            )
             message_id = "simulated_message_id"
             
             return {
@@ -68,5 +80,47 @@ class ThreemaService:
                 'error': f"Unexpected error: {str(e)}"
             }
 
+    def send_file(self, recipient, file_data, caption=None):
+        """
+        Send a file to a Threema recipient as an end-to-end encrypted file message
+        
+        Args:
+            recipient (str): Threema ID of the recipient
+            file_data (FileRecord): Metadata of the file to send
+            caption (str): Optional caption shown with the file
+            
+        Returns:
+            dict: Result of the operation
+        """
+        if not self.file_sender:
+            logger.warning("Threema file sending not configured")
+            return {
+                'success': False,
+                'error': 'Threema file sending requires THREEMA_PRIVATE_KEY'
+            }
+        
+        try:
+            message_id = self.file_sender.send_file(recipient, file_data, caption)
+            logger.info(
+                f"Sent file message to {recipient}",
+                extra={'recipient': recipient, 'file_size': file_data.size}
+            )
+            return {
+                'success': True,
+                'message_id': message_id
+            }
+        except (requests.RequestException, ValueError) as e:
+            logger.error(f"Failed to send Threema file message: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+        except Exception as e:
+            logger.error(f"Unexpected error sending Threema file message: {e}")
+            return {
+                'success': False,
+                'error': f"Unexpected error: {str(e)}"
+            }
+
 # Singleton instance
 threema_service = ThreemaService()
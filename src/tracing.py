@@ -0,0 +1,431 @@
+import os
+import json
+import time
+import queue
+import atexit
+import secrets
+import hashlib
+import logging
+import functools
+import threading
+import contextvars
+from collections import OrderedDict
+import requests
+from flask import request, make_response
+from src.logging_config import request_id_var
+
+logger = logging.getLogger(__name__)
+
+# Fraction of files whose traces are kept; the decision is per file, so a
+# sampled file is traced across every request that touches it
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '1.0'))
+
+# Where finished spans go: 'file' (JSON lines), 'http' (a collector) or 'off'
+TRACE_EXPORTER = os.getenv('TRACE_EXPORTER', 'file')
+
+# Span file for the 'file' exporter; rotated to <file>.1 beyond TRACE_FILE_MAX_BYTES
+TRACE_FILE = os.getenv(
+    'TRACE_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'traces', 'spans.jsonl')
+)
+TRACE_FILE_MAX_BYTES = int(os.getenv('TRACE_FILE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+# Collector the 'http' exporter POSTs {"spans": [...]} batches to
+TRACE_COLLECTOR_URL = os.getenv('TRACE_COLLECTOR_URL', 'http://localhost:4318/spans')
+
+# Spans waiting for the exporter thread; beyond this they are dropped instead of blocking
+TRACE_QUEUE_SIZE = int(os.getenv('TRACE_QUEUE_SIZE', '10000'))
+
+# Recent traces each process keeps in memory for the debug view
+TRACE_MEMORY_TRACES = int(os.getenv('TRACE_MEMORY_TRACES', '256'))
+
+# Whether /debug/trace/<file_id> is served; it needs no login, so it is off unless enabled
+TRACE_DEBUG_VIEW = os.getenv('TRACE_DEBUG_VIEW', 'off') == 'on'
+
+EXPORT_BATCH_SIZE = 256
+
+# Span currently open in this thread or request context
+_current_span = contextvars.ContextVar('span', default=None)
+
+def trace_id_for(file_id):
+    """
+    W3C-sized trace ID of a file
+
+    Derived from the file ID, so every hop of a file's life (upload, wallet
+    callback, delivery) joins the same trace without carrying it along.
+    """
+    return hashlib.sha256(f"trace:{file_id}".encode('utf-8')).hexdigest()[:32]
+
+def is_sampled(trace_id):
+    """Deterministic sampling decision, the same in every process"""
+    return int(trace_id[:8], 16) < TRACE_SAMPLE_RATE * 0x100000000
+
+def enabled():
+    return TRACE_EXPORTER != 'off' and TRACE_SAMPLE_RATE > 0
+
+class Span:
+    """
+    A timed operation within a trace
+
+    The outermost span of a request is its root. Child spans are collected
+    on the root and exported together once the root ends, when the file ID
+    (and so the trace ID and sampling decision) is known.
+    """
+
+    __slots__ = ('name', 'span_id', 'parent', 'root', 'file_id', 'start',
+                 '_t0', 'duration_ms', 'attrs', 'error', 'finished')
+
+    def __init__(self, name, parent, file_id, attrs):
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent = parent
+        self.root = parent.root if parent else self
+        self.file_id = None
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self.duration_ms = None
+        self.attrs = attrs
+        self.error = None
+        # Finished descendants, kept on the root only
+        self.finished = [] if parent is None else None
+        if file_id:
+            self.set_file(file_id)
+
+    def set(self, **attrs):
+        """Record attributes such as sizes or counts"""
+        self.attrs.update(attrs)
+
+    def set_file(self, file_id):
+        """Attach the trace to a file, e.g. once an upload has its ID"""
+        if self.root.file_id is None:
+            self.root.file_id = file_id
+
+    @property
+    def trace_id(self):
+        file_id = self.root.file_id
+        return trace_id_for(file_id) if file_id else None
+
+    def traceparent(self):
+        """W3C traceparent header value, or None before the file is known"""
+        trace_id = self.trace_id
+        return f"00-{trace_id}-{self.span_id}-01" if trace_id else None
+
+    def end(self):
+        self.duration_ms = (time.perf_counter() - self._t0) * 1000
+        self.root.finished.append(self)
+        if self.root is self:
+            _export(self)
+
+    def to_dict(self, trace_id):
+        return {
+            'trace_id': trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent.span_id if self.parent else None,
+            'name': self.name,
+            'file_id': self.root.file_id,
+            'start': round(self.start, 6),
+            'duration_ms': round(self.duration_ms, 3),
+            'attrs': self.attrs,
+            'error': self.error
+        }
+
+class _NoopSpan:
+    """Stands in for spans while tracing is off"""
+
+    def set(self, **attrs):
+        pass
+
+    def set_file(self, file_id):
+        pass
+
+    def traceparent(self):
+        return None
+
+_NOOP_SPAN = _NoopSpan()
+
+class span:
+    """
+    Context manager timing a block as a span of the current trace
+
+    Example:
+        with tracing.span('storage.save', size=n) as s:
+            ...
+            s.set(stored_size=m)
+
+    Args:
+        name: Span name
+        file_id: File the trace belongs to, if known
+        **attrs: Initial attributes
+    """
+
+    __slots__ = ('_span', '_token')
+
+    def __init__(self, name, file_id=None, **attrs):
+        self._span = Span(name, _current_span.get(), file_id, attrs) if enabled() else None
+
+    def __enter__(self):
+        if self._span is None:
+            return _NOOP_SPAN
+        self._token = _current_span.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._span is None:
+            return False
+        if exc_type is not None:
+            self._span.error = exc_type.__name__
+        _current_span.reset(self._token)
+        self._span.end()
+        return False
+
+def current_span():
+    """The innermost open span, or a no-op span"""
+    return _current_span.get() or _NOOP_SPAN
+
+def set_file(file_id):
+    """Attach the current trace to a file"""
+    current_span().set_file(file_id)
+
+class _TracedBody:
+    """Response body that ends the request's root span once it has been sent"""
+
+    def __init__(self, body, root):
+        self._body = body
+        self._root = root
+        self._sent = 0
+
+    def __iter__(self):
+        for chunk in self._body:
+            self._sent += len(chunk) if isinstance(chunk, bytes) else len(chunk.encode('utf-8'))
+            yield chunk
+
+    def close(self):
+        # Called by the server once the body is sent or the client went away
+        try:
+            if hasattr(self._body, 'close'):
+                self._body.close()
+        finally:
+            if self._root.duration_ms is None:
+                self._root.set(response_bytes=self._sent)
+                self._root.end()
+
+def trace_route(name, file_id_func=None):
+    """
+    Decorator recording a Flask view as the root span of a request
+
+    Streamed bodies (file downloads, bundles) are sent after the view
+    returns, so for sampled traces the root span stays open until the body
+    has been sent and records the bytes actually sent.
+
+    Args:
+        name: Span name
+        file_id_func: Optional callable returning the file ID from the view
+            kwargs, like the admission key functions
+
+    Returns:
+        Decorator for a Flask view function
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not enabled():
+                return view(*args, **kwargs)
+
+            file_id = file_id_func(kwargs) if file_id_func else None
+            root = Span(name, _current_span.get(), file_id, {
+                'method': request.method,
+                'request_bytes': request.content_length,
+                'request_id': request_id_var.get()
+            })
+            token = _current_span.set(root)
+            try:
+                response = make_response(view(*args, **kwargs))
+            except BaseException as e:
+                root.error = type(e).__name__
+                root.end()
+                raise
+            finally:
+                _current_span.reset(token)
+
+            root.set(status=response.status_code)
+            if response.status_code >= 500:
+                root.error = f"HTTP {response.status_code}"
+            traceparent = root.traceparent()
+            if traceparent:
+                response.headers['traceparent'] = traceparent
+
+            # Unsampled spans are discarded anyway, so their bodies keep the
+            # server's file wrapper (sendfile) instead of being wrapped
+            if response.is_streamed and traceparent and is_sampled(root.trace_id):
+                response.response = _TracedBody(response.response, root)
+            else:
+                root.set(response_bytes=response.content_length)
+                root.end()
+            return response
+
+        return wrapper
+    return decorator
+
+class _Exporter:
+    """
+    Background writer for finished spans
+
+    Requests hand spans to a bounded queue and never wait on disk or the
+    network; a full queue drops spans. The writer thread sends them in
+    batches to the span file or the collector.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue(TRACE_QUEUE_SIZE)
+        self.dropped = 0
+        self._fd = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._session = None
+
+    def put(self, spans):
+        if self._thread is None:
+            self._start()
+        for item in spans:
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                self.dropped += 1
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < EXPORT_BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                logger.error(f"Error exporting {len(batch)} spans: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _write(self, batch):
+        if TRACE_EXPORTER == 'http':
+            if self._session is None:
+                self._session = requests.Session()
+            self._session.post(TRACE_COLLECTOR_URL, json={'spans': batch}, timeout=5).raise_for_status()
+            return
+
+        if self._fd is None:
+            os.makedirs(os.path.dirname(TRACE_FILE), exist_ok=True)
+            self._fd = os.open(TRACE_FILE, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        # One write per batch, so lines from several workers never interleave
+        os.write(self._fd, b''.join(
+            json.dumps(item, separators=(',', ':'), default=str).encode('utf-8') + b'\n'
+            for item in batch
+        ))
+        if os.fstat(self._fd).st_size > TRACE_FILE_MAX_BYTES:
+            os.close(self._fd)
+            self._fd = None
+            os.replace(TRACE_FILE, TRACE_FILE + '.1')
+
+    def flush(self, timeout=2.0):
+        """Wait briefly for queued spans to be written"""
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+_exporter = _Exporter()
+
+# Recently exported traces of this process, newest last
+_recent = OrderedDict()
+_recent_lock = threading.Lock()
+
+def _export(root):
+    """Hand a finished request's spans to the exporter if its file is sampled"""
+    trace_id = root.trace_id
+    if trace_id is None or not is_sampled(trace_id):
+        return
+    spans = [item.to_dict(trace_id) for item in root.finished]
+
+    with _recent_lock:
+        _recent.setdefault(trace_id, []).extend(spans)
+        _recent.move_to_end(trace_id)
+        while len(_recent) > TRACE_MEMORY_TRACES:
+            _recent.popitem(last=False)
+    _exporter.put(spans)
+
+def load_trace(file_id):
+    """
+    Return the recorded spans of a file's trace, ordered by start time
+
+    Reads the span file when exporting to one, which covers all workers;
+    otherwise only this process's recent traces are available.
+    """
+    trace_id = trace_id_for(file_id)
+    if TRACE_EXPORTER != 'file':
+        with _recent_lock:
+            return sorted(_recent.get(trace_id, ()), key=lambda item: item['start'])
+
+    _exporter.flush()
+    needle = f'"trace_id":"{trace_id}"'.encode('ascii')
+    spans = []
+    for path in (TRACE_FILE + '.1', TRACE_FILE):
+        try:
+            with open(path, 'rb') as f:
+                # Skip parsing lines of other traces
+                spans.extend(json.loads(line) for line in f if needle in line)
+        except OSError:
+            continue
+    return sorted(spans, key=lambda item: item['start'])
+
+def waterfall(spans):
+    """
+    Lay out a trace's spans for the waterfall view
+
+    Args:
+        spans: Spans as returned by load_trace
+
+    Returns:
+        dict: rows (span plus depth and offset/width in percent of the
+            trace), stages (total milliseconds per request type, slowest
+            first) and duration_ms of the whole trace
+    """
+    if not spans:
+        return {'rows': [], 'stages': [], 'duration_ms': 0}
+
+    start = spans[0]['start']
+    end = max(item['start'] + item['duration_ms'] / 1000 for item in spans)
+    total_ms = max((end - start) * 1000, 0.001)
+
+    by_id = {item['span_id']: item for item in spans}
+    stages = {}
+    rows = []
+    for item in spans:
+        depth, parent = 0, by_id.get(item['parent_id'])
+        while parent is not None:
+            depth += 1
+            parent = by_id.get(parent['parent_id'])
+        if item['parent_id'] is None:
+            stages[item['name']] = stages.get(item['name'], 0) + item['duration_ms']
+
+        offset = (item['start'] - start) * 1000 / total_ms * 100
+        rows.append({
+            **item,
+            'depth': depth,
+            'offset_ms': round((item['start'] - start) * 1000, 3),
+            'offset_pct': round(offset, 3),
+            'width_pct': round(max(item['duration_ms'] / total_ms * 100, 0.2), 3)
+        })
+
+    return {
+        'rows': rows,
+        'stages': sorted(stages.items(), key=lambda stage: -stage[1]),
+        'duration_ms': round(total_ms, 3)
+    }
@@ -0,0 +1,341 @@
+import os
+import json
+import time
+import fcntl
+import base64
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+logger = logging.getLogger(__name__)
+
+# Directory holding the log segments, tree heads and signing key, on the uploads disk
+TRANSPARENCY_LOG_DIR = os.getenv(
+    'TRANSPARENCY_LOG_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'uploads', 'transparency')
+)
+
+# A new tree head is anchored once this many entries are pending...
+TRANSPARENCY_BATCH_SIZE = int(os.getenv('TRANSPARENCY_BATCH_SIZE', '64'))
+# ...or once the latest tree head is this many seconds old
+TRANSPARENCY_BATCH_INTERVAL = int(os.getenv('TRANSPARENCY_BATCH_INTERVAL', '60'))
+
+# Hashes per segment file (32 MiB of SHA-256 hashes)
+SEGMENT_HASHES = 1 << 20
+HASH_SIZE = 32
+
+def leaf_hash(data):
+    """RFC 6962 leaf hash"""
+    return hashlib.sha256(b'\x00' + data).digest()
+
+def node_hash(left, right):
+    """RFC 6962 interior node hash"""
+    return hashlib.sha256(b'\x01' + left + right).digest()
+
+def _split(size):
+    """Largest power of two strictly smaller than size"""
+    return 1 << ((size - 1).bit_length() - 1)
+
+def verify_inclusion(leaf, index, tree_size, audit_path, root):
+    """
+    Verify an RFC 6962 inclusion proof
+
+    Args:
+        leaf: Leaf hash
+        index: Leaf index
+        tree_size: Size of the tree the proof is for
+        audit_path: List of sibling hashes, leaf to root
+        root: Expected root hash
+
+    Returns:
+        bool: True if the proof is valid
+    """
+    if index >= tree_size:
+        return False
+    node, last = index, tree_size - 1
+    computed = leaf
+    for sibling in audit_path:
+        if last == 0:
+            return False
+        if node % 2 == 1 or node == last:
+            computed = node_hash(sibling, computed)
+            # Skip levels where this node has no right sibling
+            while node % 2 == 0 and node != 0:
+                node >>= 1
+                last >>= 1
+        else:
+            computed = node_hash(computed, sibling)
+        node >>= 1
+        last >>= 1
+    return last == 0 and computed == root
+
+def entry_bytes(file_id, signature):
+    """Canonical bytes of a log entry for a file signature"""
+    return json.dumps(
+        {'file_id': file_id, 'signature': signature},
+        sort_keys=True, separators=(',', ':')
+    ).encode('utf-8')
+
+class _LevelStore:
+    """
+    Append-only array of hashes for one tree level, split into segment files
+
+    Level 0 holds leaf hashes; level k holds the roots of the complete,
+    aligned subtrees of 2^k leaves, so any such subtree root is one read.
+    """
+
+    def __init__(self, directory, level):
+        self.directory = directory
+        self.level = level
+        self._fds = {}
+
+    def _fd(self, segment):
+        fd = self._fds.get(segment)
+        if fd is None:
+            path = os.path.join(self.directory, f"level-{self.level:02d}-{segment:06d}.bin")
+            fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+            self._fds[segment] = fd
+        return fd
+
+    def count(self):
+        """Number of hashes stored at this level"""
+        segment = 0
+        while True:
+            size = os.fstat(self._fd(segment)).st_size
+            if size < SEGMENT_HASHES * HASH_SIZE:
+                return segment * SEGMENT_HASHES + size // HASH_SIZE
+            segment += 1
+
+    def read(self, index):
+        segment, offset = divmod(index, SEGMENT_HASHES)
+        data = os.pread(self._fd(segment), HASH_SIZE, offset * HASH_SIZE)
+        if len(data) != HASH_SIZE:
+            raise IndexError(f"No hash {index} at level {self.level}")
+        return data
+
+    def append(self, value, index):
+        """Append a hash that will be stored at the given index"""
+        os.write(self._fd(index // SEGMENT_HASHES), value)
+
+class TransparencyLog:
+    """
+    Append-only Merkle log of file signatures
+
+    Each sign_file result becomes a leaf. Appends write the leaf hash plus
+    the roots of any subtrees it completes, which is O(1) amortized. Signed
+    tree heads are anchored in batches, and inclusion proofs are built from
+    O(log n) stored subtree roots without reading the leaves. A file lock
+    serializes appends across worker processes.
+    """
+
+    def __init__(self, directory=None):
+        """
+        Open or create a transparency log
+
+        Args:
+            directory: Directory for the log files
+        """
+        self.directory = directory or TRANSPARENCY_LOG_DIR
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._levels = []
+        self._thread_lock = threading.Lock()
+        self._lock_fd = os.open(os.path.join(self.directory, 'log.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+        self._heads_path = os.path.join(self.directory, 'heads.jsonl')
+        self._entries_fd = None
+        self._head_cache = (None, None)
+        self._init_key()
+
+    def _init_key(self):
+        """Load the tree head signing key, creating it on first use"""
+        key_path = os.path.join(self.directory, 'log_key.pem')
+        with self._locked():
+            if not os.path.exists(key_path):
+                key = ec.generate_private_key(ec.SECP256R1())
+                with open(key_path, 'wb') as f:
+                    f.write(key.private_bytes(
+                        encoding=serialization.Encoding.PEM,
+                        format=serialization.PrivateFormat.PKCS8,
+                        encryption_algorithm=serialization.NoEncryption()
+                    ))
+                os.chmod(key_path, 0o600)
+        with open(key_path, 'rb') as f:
+            self._key = serialization.load_pem_private_key(f.read(), password=None)
+        self.public_key_pem = self._key.public_key().public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo
+        ).decode('utf-8')
+
+    @contextmanager
+    def _locked(self):
+        """Serialize log writes across threads and worker processes"""
+        with self._thread_lock:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _level(self, k):
+        while len(self._levels) <= k:
+            self._levels.append(_LevelStore(self.directory, len(self._levels)))
+        return self._levels[k]
+
+    def size(self):
+        """Number of entries in the log"""
+        return self._level(0).count()
+
+    def _subtree_root(self, start, size):
+        """Root of the subtree over leaves [start, start + size)"""
+        if size & (size - 1) == 0:
+            k = size.bit_length() - 1
+            return self._level(k).read(start >> k)
+        k = _split(size)
+        return node_hash(self._subtree_root(start, k), self._subtree_root(start + k, size - k))
+
+    def _audit_path(self, index, start, size):
+        """RFC 6962 audit path for leaf index within the subtree [start, start + size)"""
+        if size == 1:
+            return []
+        k = _split(size)
+        if index < k:
+            return self._audit_path(index, start, k) + [self._subtree_root(start + k, size - k)]
+        return self._audit_path(index - k, start + k, size - k) + [self._subtree_root(start, k)]
+
+    def root(self, tree_size):
+        """Merkle root of the first tree_size entries"""
+        if tree_size == 0:
+            return hashlib.sha256(b'').digest()
+        return self._subtree_root(0, tree_size)
+
+    def append(self, data):
+        """
+        Append an entry to the log
+
+        Args:
+            data: Canonical entry bytes, see entry_bytes
+
+        Returns:
+            int: Index of the new leaf
+        """
+        with self._locked():
+            index = self.size()
+
+            if self._entries_fd is None:
+                self._entries_fd = os.open(
+                    os.path.join(self.directory, 'entries.jsonl'),
+                    os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644
+                )
+            os.write(self._entries_fd, data + b'\n')
+            self._level(0).append(leaf_hash(data), index)
+
+            # Store the root of every subtree this leaf completes. Running the
+            # loop from the stored counts also repairs a crash between writes.
+            k = 0
+            while True:
+                lower = self._level(k).count()
+                upper = self._level(k + 1).count()
+                if upper >= lower // 2:
+                    break
+                while upper < lower // 2:
+                    parent = node_hash(self._level(k).read(2 * upper), self._level(k).read(2 * upper + 1))
+                    self._level(k + 1).append(parent, upper)
+                    upper += 1
+                k += 1
+
+            self._maybe_anchor(index + 1)
+            return index
+
+    def latest_head(self):
+        """Return the most recent signed tree head, or None"""
+        try:
+            size = os.path.getsize(self._heads_path)
+        except OSError:
+            return None
+
+        cached_size, head = self._head_cache
+        if cached_size == size:
+            return head
+
+        # Read only the tail of the append-only heads file
+        with open(self._heads_path, 'rb') as f:
+            f.seek(max(0, size - 4096))
+            lines = f.read().splitlines()
+        head = json.loads(lines[-1]) if lines else None
+        self._head_cache = (size, head)
+        return head
+
+    def _maybe_anchor(self, tree_size):
+        """Anchor a new tree head if the pending batch is full or old enough"""
+        head = self.latest_head()
+        anchored = head['tree_size'] if head else 0
+        pending = tree_size - anchored
+        if pending <= 0:
+            return head
+        waited = time.time() - (head['timestamp'] if head else 0)
+        if pending >= TRANSPARENCY_BATCH_SIZE or waited >= TRANSPARENCY_BATCH_INTERVAL:
+            return self._anchor(tree_size)
+        return head
+
+    def _anchor(self, tree_size):
+        """Compute, sign and append the tree head for tree_size entries"""
+        head = {
+            'tree_size': tree_size,
+            'root_hash': base64.b64encode(self.root(tree_size)).decode('ascii'),
+            'timestamp': int(time.time())
+        }
+        message = json.dumps(head, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        head['signature'] = base64.b64encode(
+            self._key.sign(message, ec.ECDSA(hashes.SHA256()))
+        ).decode('ascii')
+
+        with open(self._heads_path, 'ab') as f:
+            f.write(json.dumps(head).encode('utf-8') + b'\n')
+        logger.info(f"Anchored transparency log tree head at size {tree_size}")
+        return head
+
+    def anchor_pending(self):
+        """Anchor pending entries whose batch interval has elapsed"""
+        with self._locked():
+            return self._maybe_anchor(self.size())
+
+    def inclusion_proof(self, index, data=None):
+        """
+        Build an inclusion proof for a leaf against the latest tree head
+
+        Args:
+            index: Leaf index returned by append
+            data: Optional entry bytes expected at that index; if given, the
+                proof is also checked against them
+
+        Returns:
+            dict: Proof with the signed tree head, or a pending status if the
+                leaf is not covered by an anchored head yet
+        """
+        head = self.anchor_pending() if self._batch_due() else self.latest_head()
+        if head is None or index >= head['tree_size']:
+            return {'status': 'pending', 'leaf_index': index}
+
+        leaf = self._level(0).read(index)
+        path = self._audit_path(index, 0, head['tree_size'])
+        proof = {
+            'status': 'included',
+            'leaf_index': index,
+            'leaf_hash': base64.b64encode(leaf).decode('ascii'),
+            'audit_path': [base64.b64encode(h).decode('ascii') for h in path],
+            'tree_head': head
+        }
+        if data is not None:
+            proof['verified'] = leaf == leaf_hash(data) and verify_inclusion(
+                leaf, index, head['tree_size'], path, base64.b64decode(head['root_hash'])
+            )
+        return proof
+
+    def _batch_due(self):
+        """Whether entries are pending past the batch interval"""
+        head = self.latest_head()
+        age = time.time() - (head['timestamp'] if head else 0)
+        return age >= TRANSPARENCY_BATCH_INTERVAL and self.size() > (head['tree_size'] if head else 0)
@@ -0,0 +1,183 @@
+import os
+import json
+import logging
+import threading
+import dataclasses
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from src import storage, chunk_store
+from src.models.file_record import FileStatus
+
+logger = logging.getLogger(__name__)
+
+class _LRUCache:
+    """Small thread-safe LRU mapping used for digests and verdicts"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+class BulkVerificationService:
+    """
+    Verifies many file signatures concurrently on a bounded thread pool
+
+    File digests are cached per (path, size, mtime) so unchanged files are
+    not re-hashed, and verdicts are cached per (file_id, digest, signature)
+    so a verdict is reused until either the file or its signature changes.
+    """
+
+    def __init__(self, signature_service, max_workers=None, cache_size=None):
+        """
+        Initialize the bulk verification service
+
+        Args:
+            signature_service: SwiyuSignatureService used to hash and verify files
+            max_workers: Size of the verification thread pool
+            cache_size: Maximum number of cached digests and verdicts
+        """
+        self.signature_service = signature_service
+        self.max_workers = max_workers or int(os.getenv('BULK_VERIFY_WORKERS', '4'))
+        cache_size = cache_size or int(os.getenv('BULK_VERIFY_CACHE_SIZE', '10000'))
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix='bulk-verify'
+        )
+        self._digests = _LRUCache(cache_size)
+        self._verdicts = _LRUCache(cache_size)
+
+    def _file_digest(self, file_data):
+        """Return the digest of a file's original bytes, hashing only if it changed"""
+        if file_data.manifest:
+            # Manifests are content-addressed, but their chunk files on disk
+            # can still be replaced or damaged
+            key = ('manifest', file_data.manifest, chunk_store.manifest_stat(file_data.manifest))
+        else:
+            file_path = file_data.path
+            stat = os.stat(file_path)
+            key = (file_path, stat.st_size, stat.st_mtime_ns)
+
+        digest = self._digests.get(key)
+        if digest is None:
+            with storage.open_original(file_data) as stream:
+                digest = self.signature_service.compute_stream_digest(stream)
+            self._digests.put(key, digest)
+
+        return digest
+
+    def verify_one(self, file_id, file_data):
+        """
+        Verify the signature of a single file
+
+        Args:
+            file_id: ID of the file
+            file_data: Snapshot of the FileRecord, or None if unknown
+
+        Returns:
+            dict: Verification result for the file
+        """
+        if file_data is None:
+            return {'file_id': file_id, 'error': 'File not found'}
+
+        signature = file_data.signature
+        if file_data.status != FileStatus.SIGNED or not signature:
+            return {'file_id': file_id, 'error': 'File is not signed'}
+
+        try:
+            digest = self._file_digest(file_data)
+            verdict_key = (file_id, digest, dataclasses.astuple(signature))
+
+            is_valid = self._verdicts.get(verdict_key)
+            cached = is_valid is not None
+            if not cached:
+                is_valid = self.signature_service.verify_digest(digest, signature.to_dict())
+                self._verdicts.put(verdict_key, is_valid)
+
+            return {
+                'file_id': file_id,
+                'valid': is_valid,
+                'signer': file_data.signer or 'unknown',
+                'cached': cached
+            }
+        except Exception as e:
+            logger.error(f"Error verifying file {file_id}: {e}")
+            return {'file_id': file_id, 'error': str(e)}
+
+    def verify_many(self, file_ids, lookup):
+        """
+        Verify many files, yielding results as they complete
+
+        At most twice the pool size is submitted at once, so memory stays
+        bounded regardless of how many IDs are requested.
+
+        Args:
+            file_ids: Iterable of file IDs
+            lookup: Callable returning the FileRecord for a file ID, or None
+
+        Yields:
+            dict: Verification result per file, in completion order
+        """
+        window = self.max_workers * 2
+        pending = set()
+
+        for file_id in file_ids:
+            file_data = lookup(file_id)
+            # Snapshot the metadata so workers never see a half-updated record
+            snapshot = dataclasses.replace(file_data) if file_data is not None else None
+            pending.add(self.executor.submit(self.verify_one, file_id, snapshot))
+
+            if len(pending) >= window:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+def parse_manifest(data):
+    """
+    Parse a verification manifest into a list of file IDs
+
+    Accepts a JSON list, a JSON object with a "file_ids" list, or plain
+    text with one file ID per line.
+
+    Args:
+        data (bytes): Raw manifest content
+
+    Returns:
+        list: File IDs in manifest order
+    """
+    text = data.decode('utf-8').strip()
+
+    try:
+        parsed = json.loads(text)
+    except ValueError:
+        parsed = None
+
+    # Anything but a JSON list or object, e.g. a single numeric ID, is plain text
+    if not isinstance(parsed, (list, dict)):
+        return [line.strip() for line in text.splitlines() if line.strip()]
+
+    if isinstance(parsed, dict):
+        parsed = parsed.get('file_ids', [])
+    if not isinstance(parsed, list):
+        raise ValueError('Manifest must contain a list of file IDs')
+
+    return [str(file_id) for file_id in parsed]
@@ -0,0 +1,88 @@
+import json
+import secrets
+import binascii
+import threading
+import libnacl.public
+from flask import Flask, request, abort
+from werkzeug.serving import make_server
+
+class FakeGateway:
+    """
+    Local stand-in for the Threema Gateway API and blob server
+
+    Serves the endpoints ThreemaFileSender uses (pubkeys, upload_blob,
+    send_e2e), keeps uploaded blobs and opens E2E messages with the
+    recipients' keys, so tests can check what a recipient would receive.
+
+    Args:
+        identity: Gateway ID accepted as sender
+        secret: Gateway API secret
+        sender_public_key: Public key of the Gateway ID, to open messages
+    """
+
+    def __init__(self, identity, secret, sender_public_key):
+        self.identity = identity
+        self.secret = secret
+        self.sender_public_key = sender_public_key
+        # Key pairs of recipients, created on first lookup
+        self.recipients = {}
+        self.blobs = {}
+        # Opened messages as (recipient, message type, content)
+        self.messages = []
+        self.url = None
+        self._server = None
+        self.app = self._create_app()
+
+    def _check_auth(self, params):
+        if params.get('from') != self.identity or params.get('secret') != self.secret:
+            abort(401)
+
+    def _create_app(self):
+        app = Flask(__name__)
+
+        @app.route('/pubkeys/<threema_id>')
+        def pubkeys(threema_id):
+            self._check_auth(request.args)
+            key = self.recipients.setdefault(threema_id, libnacl.public.SecretKey())
+            return binascii.hexlify(key.pk).decode('ascii')
+
+        @app.route('/upload_blob', methods=['POST'])
+        def upload_blob():
+            self._check_auth(request.args)
+            if 'blob' not in request.files:
+                abort(400)
+            blob_id = secrets.token_hex(16)
+            self.blobs[blob_id] = request.files['blob'].read()
+            return blob_id
+
+        @app.route('/send_e2e', methods=['POST'])
+        def send_e2e():
+            self._check_auth(request.form)
+            recipient = request.form['to']
+            if recipient not in self.recipients:
+                abort(400)
+            box = libnacl.public.Box(self.recipients[recipient], self.sender_public_key)
+            payload = box.decrypt(binascii.unhexlify(request.form['box']),
+                                  binascii.unhexlify(request.form['nonce']))
+            # Strip the PKCS#7-style padding
+            payload = payload[:-payload[-1]]
+            self.messages.append((recipient, payload[0], json.loads(payload[1:])))
+            return secrets.token_hex(8)
+
+        @app.route('/blobs/<blob_id>')
+        def blob(blob_id):
+            if blob_id not in self.blobs:
+                abort(404)
+            return self.blobs[blob_id]
+
+        return app
+
+    def start(self):
+        """Serve on a free local port in a background thread"""
+        self._server = make_server('127.0.0.1', 0, self.app, threaded=True)
+        self.url = f"http://127.0.0.1:{self._server.port}"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
@@ -0,0 +1,96 @@
+import pytest
+from src.file_store import FileStore, MAGIC, _HEADER
+from src.models.file_record import (
+    FileRecord, FileStatus, SignatureRecord, VersionRecord,
+    encode_record, decode_record, decode_fields, _pack, _unpack, _skip
+)
+
+SIGNATURE = SignatureRecord('q83vEjRWeJA=', 'SHA256withECDSA', 'did:example:123', 1700000000, 'swiyu-presentation')
+
+@pytest.mark.parametrize('value', [
+    None, True, False,
+    0, 1, 127, 128, 255, 256, 65535, 65536, 2 ** 32 - 1, 2 ** 32, 2 ** 64 - 1,
+    -1, -32, -33, -128, -129, -32768, -32769, -2 ** 31, -2 ** 31 - 1, -2 ** 63,
+    0.0, 1.5, -2.25, 1e300,
+    '', 'a', 'x' * 31, 'x' * 32, 'x' * 255, 'x' * 256, 'x' * 65536, 'grüezi ✓',
+    [], [1, 'a', None], list(range(15)), list(range(16)), [[1, [2, [3]]], 'b'],
+])
+def test_value_round_trip(value):
+    out = bytearray()
+    _pack(value, out)
+    decoded, pos = _unpack(bytes(out), 0)
+    assert decoded == value
+    assert pos == len(out)
+    assert _skip(bytes(out), 0) == len(out)
+
+def test_pack_rejects_out_of_range_and_unknown_types():
+    with pytest.raises(OverflowError):
+        _pack(2 ** 64, bytearray())
+    with pytest.raises(OverflowError):
+        _pack(-2 ** 63 - 1, bytearray())
+    with pytest.raises(TypeError):
+        _pack({'a': 1}, bytearray())
+
+def _full_record():
+    return FileRecord(
+        filename='contract.pdf', path='/uploads/abc_contract.pdf', size=123456,
+        timestamp=1700000000, status=FileStatus.SIGNED, signature=SIGNATURE,
+        signer='did:example:123', stored_size=100000, encoding='br',
+        sha256='ab' * 32, content_type='application/pdf', owner_id=7, log_index=42,
+        version=2, manifest='cd' * 32,
+        versions=[VersionRecord(1, 'contract.pdf', 120000, 1690000000, 'ef' * 32, '01' * 32,
+                                'application/pdf', FileStatus.SIGNED, SIGNATURE, 'did:example:123', 3)]
+    )
+
+@pytest.mark.parametrize('record', [
+    FileRecord(filename='a.txt', path='/uploads/a.txt', size=0, timestamp=0),
+    FileRecord(filename='b.txt', path='', size=5, timestamp=1.5, owner_id=None, log_index=0),
+    _full_record(),
+])
+def test_record_round_trip(record):
+    data = encode_record(record)
+    assert decode_record(data) == record
+    assert decode_record(b'\x00' * 3 + data, 3) == record
+
+def test_decode_fields_matches_full_decode():
+    record = _full_record()
+    data = encode_record(record)
+    names = ('timestamp', 'manifest', 'versions', 'status', 'signature', 'owner_id')
+    assert decode_fields(data, 0, names) == {name: getattr(record, name) for name in names}
+
+def test_older_records_decode_with_defaults():
+    # A schema 1 record ends before owner_id, log_index and the version fields
+    record = FileRecord(filename='old.txt', path='/uploads/old.txt', size=3, timestamp=10)
+    out = bytearray()
+    _pack(['old.txt', '/uploads/old.txt', 3, 10, 0, None, None, None, None, None, None], out)
+    assert decode_record(bytes(out)) == record
+    assert decode_fields(bytes(out), 0, ('owner_id', 'version')) == {'owner_id': None, 'version': None}
+
+def test_store_round_trip_stays_lazy(tmp_path):
+    path = str(tmp_path / 'files_db.bin')
+    store = FileStore(path)
+    store['a'] = _full_record()
+    store['b'] = FileRecord(filename='b.txt', path='/uploads/b.txt', size=1, timestamp=5)
+    store.save()
+
+    reopened = FileStore(path)
+    assert sorted(reopened) == ['a', 'b']
+    assert dict(reopened.records()) == {'a': store['a'], 'b': store['b']}
+    assert dict(reopened.scan(('timestamp',))) == {'a': {'timestamp': 1700000000}, 'b': {'timestamp': 5}}
+    # Scans decode for the caller only; entries stay as offsets
+    assert all(isinstance(value, int) for value in reopened._entries.values())
+
+    reopened['b'].size = 2
+    reopened.save()
+    again = FileStore(path)
+    assert again['a'] == store['a']
+    assert again['b'].size == 2
+
+def test_store_rejects_foreign_files(tmp_path):
+    path = tmp_path / 'files_db.bin'
+    path.write_bytes(_HEADER.pack(b'NOPE', 1, 0))
+    with pytest.raises(ValueError):
+        FileStore(str(path))
+    path.write_bytes(_HEADER.pack(MAGIC, 99, 0))
+    with pytest.raises(ValueError):
+        FileStore(str(path))
@@ -0,0 +1,31 @@
+import io
+import os
+import pytest
+from src import storage
+from src.models.file_record import FileRecord
+
+def _store(tmp_path, monkeypatch, encoding, data):
+    monkeypatch.setattr(storage, 'STORAGE_COMPRESSION', encoding)
+    stored = storage.save_upload(io.BytesIO(data), str(tmp_path / 'doc.txt'), 'text/plain')
+    assert stored['encoding'] == encoding
+    return FileRecord(filename='doc.txt', timestamp=0, **stored)
+
+@pytest.mark.parametrize('encoding', ['br', 'gzip'])
+@pytest.mark.parametrize('data', [
+    b'',
+    os.urandom(3 * storage.CHUNK_SIZE + 5) + b'a' * 1000000,
+    # Expands far beyond one read of the stored file
+    b'\x00' * (8 * 1024 * 1024),
+], ids=['empty', 'mixed', 'zeros'])
+def test_open_original_round_trip(tmp_path, monkeypatch, encoding, data):
+    record = _store(tmp_path, monkeypatch, encoding, data)
+    with storage.open_original(record) as stream:
+        assert b''.join(iter(lambda: stream.read(12345), b'')) == data
+
+@pytest.mark.parametrize('encoding', ['br', 'gzip'])
+def test_open_original_rejects_truncated_file(tmp_path, monkeypatch, encoding):
+    record = _store(tmp_path, monkeypatch, encoding, os.urandom(100000) * 3)
+    with open(record.path, 'r+b') as f:
+        f.truncate(os.path.getsize(record.path) // 2)
+    with storage.open_original(record) as stream, pytest.raises(IOError):
+        stream.read()
@@ -0,0 +1,89 @@
+import io
+import os
+import libnacl
+import libnacl.public
+import pytest
+from flask import Flask
+from threema.gateway.key import Key
+from src import storage
+from src.models.user import db
+from src.models.file_record import FileRecord
+from src.threema_files import ThreemaFileSender, encrypt_stream, _MultipartFile, FILE_NONCE, FILE_MESSAGE_TYPE
+from tests.fake_gateway import FakeGateway
+
+IDENTITY = '*TESTGW1'
+SECRET = 'test-secret'
+
+@pytest.mark.parametrize('size', [0, 1, 31, 32, 63, 64, 65, 1000, storage.CHUNK_SIZE, 3 * storage.CHUNK_SIZE + 17])
+def test_encrypt_stream_matches_secretbox(size):
+    plaintext = os.urandom(size)
+    key = libnacl.utils.salsa_key()
+    out = io.BytesIO()
+    written = encrypt_stream(io.BytesIO(plaintext), out, key, FILE_NONCE)
+    assert out.getvalue() == libnacl.crypto_secretbox(plaintext, FILE_NONCE, key)
+    assert written == size + 16
+
+def test_encrypt_stream_writes_after_existing_output():
+    key = libnacl.utils.salsa_key()
+    out = io.BytesIO()
+    out.write(b'prefix')
+    encrypt_stream(io.BytesIO(b'data'), out, key, FILE_NONCE)
+    assert out.getvalue() == b'prefix' + libnacl.crypto_secretbox(b'data', FILE_NONCE, key)
+
+def test_multipart_file_length_matches_body():
+    data = os.urandom(5000)
+    body = _MultipartFile('blob', io.BytesIO(data), len(data))
+    read = b''.join(iter(lambda: body.read(1000), b''))
+    assert len(read) == len(body)
+    assert data in read
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'test.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+
+@pytest.fixture
+def gateway_key():
+    return libnacl.public.SecretKey()
+
+@pytest.fixture
+def gateway(gateway_key):
+    gateway = FakeGateway(IDENTITY, SECRET, gateway_key.pk).start()
+    yield gateway
+    gateway.stop()
+
+@pytest.fixture
+def stored_file(tmp_path):
+    content = b'%PDF-1.4 signed document\n' * 20000
+    stored = storage.save_upload(io.BytesIO(content), str(tmp_path / 'doc.pdf'), 'application/pdf')
+    return content, FileRecord(filename='doc.pdf', timestamp=1700000000, **stored)
+
+def test_send_file_through_gateway(app, gateway, gateway_key, stored_file):
+    content, file_data = stored_file
+    sender = ThreemaFileSender(IDENTITY, SECRET, Key.encode(gateway_key), gateway.url)
+
+    sender.send_file('ECHOECHO', file_data, caption='Verify it here')
+
+    recipient, message_type, message = gateway.messages[0]
+    assert recipient == 'ECHOECHO'
+    assert message_type == FILE_MESSAGE_TYPE
+    assert (message['n'], message['m'], message['s'], message['d']) == \
+        ('doc.pdf', 'application/pdf', len(content), 'Verify it here')
+
+    # The recipient decrypts the blob with the key from the message
+    blob = gateway.blobs[message['b']]
+    assert libnacl.crypto_secretbox_open(blob, FILE_NONCE, bytes.fromhex(message['k'])) == content
+
+def test_send_file_reuses_blob_for_further_recipients(app, gateway, gateway_key, stored_file):
+    _, file_data = stored_file
+    sender = ThreemaFileSender(IDENTITY, SECRET, Key.encode(gateway_key), gateway.url)
+
+    sender.send_file('ECHOECHO', file_data)
+    sender.send_file('ABCDEFGH', file_data)
+
+    assert len(gateway.blobs) == 1
+    assert [message['b'] for _, _, message in gateway.messages] == [next(iter(gateway.blobs))] * 2